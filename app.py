@@ -1,25 +1,395 @@
 # app.py
-from flask import Flask, render_template, request, jsonify, session
+from flask import Blueprint, Flask, current_app, render_template, request, jsonify, session, stream_with_context, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import text
-import qrcode
+from sqlalchemy import text, or_, and_, event, false
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as OrmSession, aliased, joinedload
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from jinja2 import ModuleLoader
 import os
-from datetime import datetime
-import random
-import string
+import sys
+from datetime import datetime, timedelta
 import sqlite3
+import base64
+import re
+import secrets
+import csv
+import hashlib
+import io
+import json
+import queue
+import struct
+import zlib
+import threading
+import time
+import functools
+import click
+import random
+from collections import Counter, OrderedDict
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+SECRET_KEY = 'tikozetu-secret-key-2023'
+# SQLite only: migrations, upserts, event search and the archive rely on it. The
+# platform-wide DATABASE_URL is deliberately ignored; it is often a Postgres URL.
+DATABASE_URI = os.environ.get('TIKOZETU_DATABASE_URI') or 'sqlite:///tikozetu.db'
+
+# Templates precompiled with `flask compile-templates` into this directory are
+# loaded as Python modules instead of being parsed on first render. Off unless
+# set; recompile after editing a template.
+COMPILED_TEMPLATES_DIR = os.environ.get('TIKOZETU_COMPILED_TEMPLATES')
+
+# Database engine tuning; every setting can be overridden through the environment.
+# TIKOZETU_DB_TUNING=0 falls back to the driver and pool defaults.
+DB_TUNING = os.environ.get('TIKOZETU_DB_TUNING', '1') != '0'
+DB_POOL_SIZE = int(os.environ.get('TIKOZETU_DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('TIKOZETU_DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = int(os.environ.get('TIKOZETU_DB_POOL_TIMEOUT', 30))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('TIKOZETU_SQLITE_BUSY_TIMEOUT_MS', 15000))
+SQLITE_MMAP_SIZE = int(os.environ.get('TIKOZETU_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('TIKOZETU_SQLITE_CACHE_SIZE_KB', 64 * 1024))
+
+def database_engine_options(uri):
+    """Connection pool settings for the configured database"""
+    if not DB_TUNING:
+        return {}
+    if ':memory:' in uri or uri in ('sqlite://', 'sqlite:///'):
+        # In-memory databases live in a single connection; keep Flask-SQLAlchemy's default pool
+        return {}
+    # One connection per worker thread; sqlite3's own timeout matches busy_timeout
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'connect_args': {'check_same_thread': False, 'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}
+    }
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """Apply the production pragmas to every new SQLite connection"""
+    if not DB_TUNING or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers run alongside the single writer; NORMAL sync is durable under WAL
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    cursor.close()
+
+# Event listing pagination
+EVENTS_PAGE_SIZE = 50
+EVENTS_MAX_PAGE_SIZE = 200
+
+# Attendee ticket wallet pagination
+TICKETS_PAGE_SIZE = 50
+TICKETS_MAX_PAGE_SIZE = 200
+TICKET_STATUSES = ['unpaid', 'pending', 'paid', 'expired']
+
+# Pending payments pagination
+PAYMENTS_PAGE_SIZE = 50
+PAYMENTS_MAX_PAGE_SIZE = 500
+
+# Largest number of payments a single bulk confirm/reject request may touch
+BULK_PAYMENTS_MAX = 1000
+
+# Statement lines matched against pending payments per query/commit during reconciliation
+RECONCILE_BATCH_SIZE = 500
+
+# Accepted M-PESA statement column headers, compared case-insensitively
+STATEMENT_CODE_COLUMNS = ['receipt no.', 'receipt no', 'receipt', 'transaction code', 'transid', 'mpesa code']
+STATEMENT_AMOUNT_COLUMNS = ['paid in', 'amount', 'transamount']
+STATEMENT_STATUS_COLUMNS = ['transaction status', 'status']
+
+# Unpaid tickets hold their seats for this long before returning them to inventory
+TICKET_HOLD_MINUTES = 15
+# The event listing and the dashboard release every expired hold at most this
+# often per process, so seat counts do not wait for someone to try booking
+HOLD_SWEEP_SECONDS = 30
+
+# `flask archive` moves events dated more than ARCHIVE_AFTER_DAYS ago, with their
+# tickets and payments, into an archive SQLite database: TIKOZETU_ARCHIVE_PATH,
+# or <main database>-archive.db beside the main file. Each batch moves about
+# ARCHIVE_BATCH_ROWS tickets; a bigger event moves on its own.
+ARCHIVE_PATH = os.environ.get('TIKOZETU_ARCHIVE_PATH')
+ARCHIVE_AFTER_DAYS = int(os.environ.get('TIKOZETU_ARCHIVE_AFTER_DAYS', 180))
+ARCHIVE_BATCH_ROWS = 5000
+
+# Booking and payment submission accept an Idempotency-Key header. The first
+# successful response to a key is kept this long and replayed to retries.
+IDEMPOTENCY_TTL_HOURS = 24
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Expired keys are swept in batches, at most this often per process
+IDEMPOTENCY_PURGE_SECONDS = 300
+IDEMPOTENCY_PURGE_BATCH = 1000
+
+# Rows fetched per round trip when streaming an event export
+EXPORT_BATCH_SIZE = 1000
+
+# QR codes are rendered off the request path by this many worker processes
+QR_RENDER_WORKERS = 2
+
+# QR images are rendered on demand and kept in an in-process LRU cache
+QR_BOX_SIZE = 8
+QR_BORDER = 4
+# A fixed mask skips qrcode's scoring of all eight masks, the bulk of its render time
+QR_MASK_PATTERN = 0
+QR_CACHE_MAX_BYTES = 8 * 1024 * 1024
+QR_CACHE_MAX_AGE = 7 * 24 * 3600
+
+# Public read endpoints are cached in-process. Writes invalidate entries in
+# the worker that handled them; other workers catch up within the TTL.
+RESPONSE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+RESPONSE_CACHE_TTL = 30
+
+# Password hashing: new hashes use this method, older ones are upgraded on login.
+# Hashing runs on a small pool so a login burst cannot occupy every worker thread.
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+AUTH_HASH_WORKERS = 2
+AUTH_HASH_QUEUE = 16
+AUTH_HASH_TIMEOUT = 10
+
+# Rows per executemany batch when loading synthetic data with `flask seed`
+SEED_BATCH_SIZE = 50000
+
+# Token buckets for /api/login and /api/register: (burst size, tokens per minute)
+LOGIN_LIMIT_PER_IP = (20, 10)
+LOGIN_LIMIT_PER_EMAIL = (5, 5)
+REGISTER_LIMIT_PER_IP = (5, 2)
+# Reverse proxies in front of the app (nginx, Vercel's edge) whose X-Forwarded-For
+# and X-Forwarded-Proto are trusted, so the per-IP buckets see the real client.
+# None by default: without a proxy, trusting the header would let clients pick
+# their own IP. vercel.json and gunicorn.conf.py set it to 1.
+PROXY_HOPS = int(os.environ.get('TIKOZETU_PROXY_HOPS', 0))
+
+# Opt-in request instrumentation (TIKOZETU_METRICS=1). When off, no hooks are
+# installed and /metrics is a 404. A sampled request that turns out slower than
+# METRICS_SLOW_REQUEST_MS has its cProfile stats written to METRICS_PROFILE_DIR.
+METRICS_ENABLED = os.environ.get('TIKOZETU_METRICS') == '1'
+METRICS_TOKEN = os.environ.get('TIKOZETU_METRICS_TOKEN')
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.environ.get('TIKOZETU_METRICS_N_PLUS_ONE', 10))
+METRICS_SLOW_REQUEST_MS = float(os.environ.get('TIKOZETU_METRICS_SLOW_MS', 500))
+METRICS_PROFILE_SAMPLE_RATE = float(os.environ.get('TIKOZETU_METRICS_PROFILE_RATE', 0))
+METRICS_PROFILE_DIR = os.environ.get('TIKOZETU_METRICS_PROFILE_DIR', 'profiles')
+
+# Live updates over /api/stream. An open stream is parked on its queue between
+# events; gunicorn.conf.py runs gevent workers, so that costs a greenlet rather
+# than a thread. Notifications only reach streams held by the process that made
+# the change.
+STREAM_QUEUE_SIZE = 100
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_MAX_SUBSCRIBERS = 5000
+
+db = SQLAlchemy()
+
+# Every route and hook is registered on this blueprint; create_app() attaches it
+bp = Blueprint('tikozetu', __name__, cli_group=None)
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values, with optional TTL"""
+    
+    def __init__(self, max_bytes, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.size -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value, size=None):
+        size = len(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (value, size, expires_at)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+    
+    def invalidate(self, prefix):
+        """Drop every entry whose (string) key starts with prefix"""
+        with self._lock:
+            for key in [key for key in self._entries if isinstance(key, str) and key.startswith(prefix)]:
+                self.size -= self._entries.pop(key)[1]
+                self.invalidations += 1
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'tikozetu-secret-key-2023'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///tikozetu.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+response_cache = LRUCache(RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL)
 
-# Add CORS support
-CORS(app)
+# Response headers that are part of a cached representation
+CACHED_RESPONSE_HEADERS = ['X-Next-Cursor']
 
-db = SQLAlchemy(app)
+def cached_response(view):
+    """Serve a public GET endpoint from the response cache, keyed by path and query string.
+
+    Responses carry a strong ETag, so If-None-Match on a cached entry gets a
+    304 without touching the database. Only 200 responses are cached.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.full_path
+        entry = response_cache.get(key)
+        if entry is None:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            headers = {name: response.headers[name] for name in CACHED_RESPONSE_HEADERS if name in response.headers}
+            entry = (body, hashlib.sha1(body).hexdigest(), response.mimetype, headers)
+            response_cache.put(key, entry, len(body))
+        
+        body, etag, mimetype, headers = entry
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304, headers=headers)
+        else:
+            response = current_app.response_class(body, mimetype=mimetype, headers=headers)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
+
+def invalidate_event_cache(event_id=None):
+    """Drop cached event listings, and the payment info of one event if given"""
+    response_cache.invalidate('/api/events?')
+    if event_id is not None:
+        response_cache.invalidate(f'/api/events/{event_id}/')
+
+# Live updates
+class StreamSubscriber:
+    """One open /api/stream connection and the channels it listens on"""
+    
+    def __init__(self, channels):
+        self.channels = set(channels)
+        self.queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        # Set when a notification was dropped; the client is told to refetch
+        self.overflowed = False
+
+class NotificationBroker:
+    """In-process pub/sub fanning notifications out to stream subscribers.
+
+    Publishing never blocks: a subscriber whose queue is full loses the
+    notification and is flagged for a resync instead.
+    """
+    
+    def __init__(self):
+        self._channels = {}
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    def subscribe(self, channels):
+        """Register a subscriber, or return None if the process is at STREAM_MAX_SUBSCRIBERS"""
+        with self._lock:
+            if self._count >= STREAM_MAX_SUBSCRIBERS:
+                return None
+            subscriber = StreamSubscriber(channels)
+            for channel in subscriber.channels:
+                self._channels.setdefault(channel, set()).add(subscriber)
+            self._count += 1
+            return subscriber
+    
+    def add_channel(self, subscriber, channel):
+        with self._lock:
+            subscriber.channels.add(channel)
+            self._channels.setdefault(channel, set()).add(subscriber)
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for channel in subscriber.channels:
+                listeners = self._channels.get(channel)
+                if listeners is not None:
+                    listeners.discard(subscriber)
+                    if not listeners:
+                        del self._channels[channel]
+            self._count -= 1
+    
+    def publish(self, channel, name, data):
+        with self._lock:
+            listeners = list(self._channels.get(channel, ()))
+        for subscriber in listeners:
+            try:
+                subscriber.queue.put_nowait((name, data))
+            except queue.Full:
+                subscriber.overflowed = True
+    
+    def stats(self):
+        with self._lock:
+            return {'subscribers': self._count, 'channels': len(self._channels)}
+
+notification_broker = NotificationBroker()
+
+def queue_notification(channel, name, data):
+    """Publish a notification once the current transaction commits; dropped on rollback"""
+    db.session.info.setdefault('notifications', []).append((channel, name, data))
+
+@event.listens_for(OrmSession, 'after_commit')
+def publish_notifications(orm_session):
+    for channel, name, data in orm_session.info.pop('notifications', ()):
+        notification_broker.publish(channel, name, data)
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_notifications(orm_session):
+    orm_session.info.pop('notifications', None)
+
+def notify_ticket_status(attendee_id, ticket_id, payment_status):
+    queue_notification(f'user:{attendee_id}', 'ticket_status', {
+        'ticket_id': ticket_id, 'payment_status': payment_status
+    })
+
+def notify_payment_resolved(event_id, payment_id, status):
+    queue_notification(f'event:{event_id}', 'payment_resolved', {
+        'event_id': event_id, 'payment_id': payment_id, 'status': status
+    })
+
+def format_stream_message(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
 
 # Database Models
 class User(db.Model):
@@ -39,12 +409,22 @@ class Event(db.Model):
     location = db.Column(db.String(200), nullable=False)
     price = db.Column(db.Float, nullable=False)
     capacity = db.Column(db.Integer, nullable=False)
-    organizer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Seats not yet held by a ticket; decremented atomically by book_ticket
+    tickets_remaining = db.Column(
+        db.Integer,
+        nullable=False,
+        default=lambda context: context.get_current_parameters()['capacity']
+    )
+    organizer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     image_url = db.Column(db.String(500))
     
     organizer = db.relationship('User', backref=db.backref('events', lazy=True))
 
+    # Keyset pagination walks events in (date, id) order. Archived rows keep
+    # their ids, so ids are never handed out twice (see add_autoincrement_ids).
+    __table_args__ = (db.Index('ix_event_date_id', 'date', 'id'), {'sqlite_autoincrement': True})
+
 class EventPayment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
@@ -53,6 +433,8 @@ class EventPayment(db.Model):
     payment_instructions = db.Column(db.Text, nullable=True)
     
     event = db.relationship('Event', backref=db.backref('payment_info', lazy=True))
+    
+    __table_args__ = {'sqlite_autoincrement': True}
 
 class Ticket(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -62,12 +444,26 @@ class Ticket(db.Model):
     total_price = db.Column(db.Float, nullable=False)
     booking_reference = db.Column(db.String(20), unique=True, nullable=False)
     qr_code_path = db.Column(db.String(500))
+    qr_status = db.Column(db.String(20), nullable=True)  # queued, ready, failed
     is_checked_in = db.Column(db.Boolean, default=False)
-    payment_status = db.Column(db.String(20), default='unpaid')  # unpaid, pending, paid
+    checked_in_at = db.Column(db.DateTime, nullable=True)
+    payment_status = db.Column(db.String(20), default='unpaid')  # unpaid, pending, paid, expired
+    hold_expires_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every ORM and Core UPDATE of the ticket; the wallet's ETag is built from it
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     event = db.relationship('Event', backref=db.backref('tickets', lazy=True))
     attendee = db.relationship('User', backref=db.backref('tickets', lazy=True))
+    
+    __table_args__ = (
+        db.Index('ix_ticket_event_id', 'event_id'),
+        # Serves the attendee's wallet newest first; also covers lookups by attendee alone
+        db.Index('ix_ticket_attendee_created', 'attendee_id', 'created_at'),
+        # Only holds still awaiting payment, for sweep_expired_holds
+        db.Index('ix_ticket_unpaid_hold', 'hold_expires_at', sqlite_where=text("payment_status = 'unpaid'")),
+        {'sqlite_autoincrement': True},
+    )
 
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -75,26 +471,1477 @@ class Payment(db.Model):
     amount = db.Column(db.Float, nullable=False)
     payment_method = db.Column(db.String(50), nullable=False)
     payment_reference = db.Column(db.String(100), nullable=False)
+    # payment_reference upper-cased with everything but letters and digits removed
+    reference_key = db.Column(db.String(100), index=True)
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, rejected
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     confirmed_at = db.Column(db.DateTime, nullable=True)
     
     ticket = db.relationship('Ticket', backref=db.backref('payment', uselist=False))
+    
+    __table_args__ = (
+        # The pending queue filters on status, then joins through ticket_id
+        db.Index('ix_payment_status_ticket_id', 'status', 'ticket_id'),
+        # A ticket has at most one pending or confirmed payment, and a transaction
+        # code can back only one of them; rejected payments keep their history
+        db.Index('ux_payment_active_ticket', 'ticket_id', unique=True,
+                 sqlite_where=text("status IN ('pending', 'confirmed')")),
+        db.Index('ux_payment_active_reference', 'reference_key', unique=True,
+                 sqlite_where=text("status IN ('pending', 'confirmed') AND reference_key != ''")),
+        {'sqlite_autoincrement': True},
+    )
+
+# Dashboard counters per event, kept current by the ticket and payment routes
+class EventStats(db.Model):
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    total_tickets = db.Column(db.Integer, nullable=False, default=0)
+    confirmed_tickets = db.Column(db.Integer, nullable=False, default=0)
+    pending_payments = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+# Responses kept for Idempotency-Key replays; see idempotent()
+class IdempotencyKey(db.Model):
+    # Truncated sha256 digests keep rows small: the key covers the user and the
+    # client's header, the request hash the method, path and body
+    key = db.Column(db.LargeBinary(16), primary_key=True)
+    request_hash = db.Column(db.LargeBinary(16), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)  # NULL until the response is stored
+    response_body = db.Column(db.Text, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_idempotency_key_expires_at', 'expires_at'),
+        {'sqlite_with_rowid': False},
+    )
+
+# What stays in the live database of an event moved to the archive, for the dashboard
+class ArchivedEventSummary(db.Model):
+    event_id = db.Column(db.Integer, primary_key=True)
+    organizer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    total_tickets = db.Column(db.Integer, nullable=False, default=0)
+    confirmed_tickets = db.Column(db.Integer, nullable=False, default=0)
+    pending_payments = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# The archive's copies of the live tables, in the schema attach_archive() attaches
+# as "archive". Columns and lookup indexes only: rows arrive already validated.
+ARCHIVE_INDEXES = {
+    'event': [['date', 'id'], ['organizer_id']],
+    'event_payment': [['event_id']],
+    'ticket': [['attendee_id', 'created_at'], ['event_id']],
+    'payment': [['ticket_id']],
+}
+archive_metadata = db.MetaData()
+
+def build_archive_table(name, indexes):
+    source = db.metadata.tables[name]
+    table = db.Table(name, archive_metadata, *[
+        db.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+        for column in source.columns
+    ], schema='archive')
+    for columns in indexes:
+        db.Index(f"ix_{name}_{'_'.join(columns)}", *[table.c[column] for column in columns])
+    return table
 
-# Function to check and update database schema
-def check_and_update_schema():
-    """Check if database schema needs to be updated and handle it"""
+archive_tables = {name: build_archive_table(name, indexes) for name, indexes in ARCHIVE_INDEXES.items()}
+
+# Read-only stand-ins for the models over the archive, for queries made with archived=1
+ArchivedEvent = aliased(Event, archive_tables['event'], adapt_on_names=True)
+ArchivedTicket = aliased(Ticket, archive_tables['ticket'], adapt_on_names=True)
+ArchivedPayment = aliased(Payment, archive_tables['payment'], adapt_on_names=True)
+
+# Schema migrations
+_schema_checked = set()
+_schema_lock = threading.Lock()
+
+def check_and_update_schema(sample_data=True):
+    """Apply any schema migrations the database has not seen yet.
+
+    The applied version is kept in SQLite's user_version, so an up-to-date
+    database costs a single pragma read. Every migration is idempotent and
+    never drops data; a database that has never been set up also gets the
+    sample data unless sample_data is False.
+    
+    The pending migrations run in one transaction that holds the write lock
+    from the start. Processes upgrading the same file at once wait their
+    turn, then find user_version already current; a failed upgrade rolls
+    back whole.
+    """
+    version = db.session.execute(text('PRAGMA user_version')).scalar()
+    if version >= len(SCHEMA_MIGRATIONS):
+        return
+    
+    db.session.execute(text('BEGIN IMMEDIATE'))
     try:
-        # Try to query the Ticket table to see if payment_status column exists
-        db.session.execute(text('SELECT payment_status FROM ticket LIMIT 1'))
-        print("Database schema is up to date.")
-    except Exception as e:
-        print("Database schema needs update. Recreating database...")
-        # Drop all tables and recreate
-        db.drop_all()
-        db.create_all()
+        version = db.session.execute(text('PRAGMA user_version')).scalar()
+        applied = []
+        for number, migration in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+            migration()
+            db.session.execute(text(f'PRAGMA user_version = {number}'))
+            applied.append(f"Applied schema migration {number}: {migration.__name__}")
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    for line in applied:
+        print(line)
+    
+    # Only seeds a database without any users
+    if sample_data:
         create_sample_data()
-        print("Database recreated successfully.")
+
+@bp.before_app_request
+def ensure_schema_current():
+    """Run pending migrations once per process and database, before the first request is served.
+
+    Under gunicorn, `flask migrate` has already run before any worker started
+    (see gunicorn.conf.py), so this only reads user_version. Deployments never
+    get the sample accounts; only `python app.py` seeds them.
+    """
+    uri = current_app.config['SQLALCHEMY_DATABASE_URI']
+    if uri in _schema_checked:
+        return
+    with _schema_lock:
+        if uri not in _schema_checked:
+            check_and_update_schema(sample_data=False)
+            _schema_checked.add(uri)
+
+# The tables of the original schema. Every table added since is created by
+# its own migration, which also fills it from the rows already there.
+BASE_TABLES = ['user', 'event', 'event_payment', 'ticket', 'payment']
+
+def create_base_schema():
+    """Create any missing tables of the original schema, and the columns older databases lack"""
+    db.metadata.create_all(db.session.connection(), tables=[db.metadata.tables[name] for name in BASE_TABLES])
+    # Databases from before payments were tracked on tickets
+    add_column_if_missing('ticket', 'payment_status', "VARCHAR(20) DEFAULT 'unpaid'")
+
+def add_lookup_indexes():
+    """Index the foreign keys that per-user and per-organizer queries filter on.
+
+    event.date and payment.status lead ix_event_date_id and
+    ix_payment_status_ticket_id, which serve those lookups already.
+    """
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_ticket_attendee_id ON ticket (attendee_id)'))
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_event_organizer_id ON event (organizer_id)'))
+
+def add_column_if_missing(table, column, column_type):
+    """Add a column to an existing table, returning True if it was missing"""
+    columns = {row[1] for row in db.session.execute(text(f'PRAGMA table_info({table})'))}
+    if column in columns:
+        return False
+    db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}'))
+    return True
+
+# Ticket inventory
+def ensure_inventory_schema():
+    """Add the inventory columns to databases created before they existed"""
+    if add_column_if_missing('event', 'tickets_remaining', 'INTEGER'):
+        # Seats already held by live tickets are not available
+        db.session.execute(text(
+            "UPDATE event SET tickets_remaining = MAX(capacity - COALESCE(("
+            "SELECT SUM(quantity) FROM ticket WHERE ticket.event_id = event.id "
+            "AND ticket.payment_status != 'expired'), 0), 0)"
+        ))
+    add_column_if_missing('ticket', 'hold_expires_at', 'DATETIME')
+    add_column_if_missing('ticket', 'checked_in_at', 'DATETIME')
+
+def reserve_seats(event_id, quantity):
+    """Atomically take seats from an event's inventory.
+
+    Returns the (price, title) of the event, or None if it does not exist or
+    has fewer than `quantity` seats left. The conditional UPDATE makes the
+    check and the decrement a single statement, so concurrent bookings
+    can never oversell.
+    """
+    statement = db.update(Event).where(
+        Event.id == event_id,
+        Event.tickets_remaining >= quantity
+    ).values(
+        tickets_remaining=Event.tickets_remaining - quantity
+    ).returning(Event.price, Event.title)
+    return db.session.execute(statement).first()
+
+def release_expired_holds(event_id):
+    """Return the seats of unpaid tickets whose hold has expired.
+
+    Only tickets still marked unpaid are flipped, so a hold released by
+    another worker is never returned twice. The released tickets stop
+    counting towards the event's total. Returns the number of seats freed.
+    """
+    statement = db.update(Ticket).where(
+        Ticket.event_id == event_id,
+        Ticket.payment_status == 'unpaid',
+        Ticket.hold_expires_at < datetime.utcnow()
+    ).values(payment_status='expired').returning(Ticket.quantity)
+    released = db.session.execute(statement).all()
+    freed = sum(row.quantity for row in released)
+    if freed:
+        db.session.execute(db.update(Event).where(Event.id == event_id).values(
+            tickets_remaining=Event.tickets_remaining + freed
+        ))
+        bump_event_stats(event_id, total_tickets=-len(released))
+    return freed
+
+_holds_swept_at = 0.0
+
+def sweep_expired_holds():
+    """Release the expired holds of every event, at most once per HOLD_SWEEP_SECONDS.
+
+    Commits what it releases, so call it before the request's own writes.
+    """
+    global _holds_swept_at
+    if time.monotonic() - _holds_swept_at < HOLD_SWEEP_SECONDS:
+        return
+    _holds_swept_at = time.monotonic()
+    # Read through ix_ticket_unpaid_hold; DISTINCT would walk every ticket by event instead
+    event_ids = set(db.session.execute(db.select(Ticket.event_id).where(
+        Ticket.payment_status == 'unpaid',
+        Ticket.hold_expires_at < datetime.utcnow()
+    )).scalars())
+    if not event_ids:
+        return
+    for event_id in sorted(event_ids):
+        release_expired_holds(event_id)
+    db.session.commit()
+    invalidate_event_cache()
+
+# Booking references
+# Crockford base32: no I, L, O or U, so references survive being read out or retyped
+BOOKING_REF_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+# generate_booking_reference encodes two characters at a time: each pair and its
+# Luhn contribution (the right-hand character is the doubled one) come from a table
+BOOKING_REF_PAIRS = [high + low for high in BOOKING_REF_ALPHABET for low in BOOKING_REF_ALPHABET]
+BOOKING_REF_PAIR_WEIGHTS = [high + (2 * low) // 32 + (2 * low) % 32 for high in range(32) for low in range(32)]
+BOOKING_REF_VALUES = {char: value for value, char in enumerate(BOOKING_REF_ALPHABET)}
+BOOKING_REF_ALIASES = str.maketrans('OIL', '011')
+BOOKING_REF_TIME_CHARS = 8
+# 8 characters hold 40 bits of milliseconds, about 34.8 years, counted from 2026-01-01 UTC
+BOOKING_REF_EPOCH_MS = 1767225600000
+BOOKING_REF_RANDOM_BITS = 30
+BOOKING_REF_LENGTH = BOOKING_REF_TIME_CHARS + BOOKING_REF_RANDOM_BITS // 5 + 1
+
+_booking_ref_lock = threading.Lock()
+_booking_ref_last = (0, 0)
+
+def booking_reference_check_char(body):
+    """Luhn mod 32 check character; catches any single wrong character and most swaps"""
+    total = 0
+    factor = 2
+    for char in reversed(body):
+        addend = factor * BOOKING_REF_VALUES[char]
+        total += addend // 32 + addend % 32
+        factor = 1 if factor == 2 else 2
+    return BOOKING_REF_ALPHABET[-total % 32]
+
+def generate_booking_reference():
+    """Issue a new booking reference: 8 characters of milliseconds since
+    BOOKING_REF_EPOCH_MS, 6 of randomness from secrets and a check character.
+
+    References sort by issue time until the timestamp runs out on 2060-11-03,
+    which keeps inserts into the unique index at its right-hand edge. Within
+    a process the random part is incremented when the clock has not moved
+    on, so a process never repeats itself; across processes a clash needs
+    the same millisecond and 30 random bits.
+    """
+    global _booking_ref_last
+    with _booking_ref_lock:
+        millis = int(time.time() * 1000) - BOOKING_REF_EPOCH_MS
+        last_millis, last_random = _booking_ref_last
+        if millis <= last_millis:
+            millis, random_part = last_millis, last_random + 1
+            if random_part >> BOOKING_REF_RANDOM_BITS:
+                millis, random_part = last_millis + 1, secrets.randbits(BOOKING_REF_RANDOM_BITS)
+        else:
+            random_part = secrets.randbits(BOOKING_REF_RANDOM_BITS)
+        _booking_ref_last = (millis, random_part)
+    value = millis << BOOKING_REF_RANDOM_BITS | random_part
+    chunks = []
+    total = 0
+    for _ in range((BOOKING_REF_LENGTH - 1) // 2):
+        value, index = divmod(value, 1024)
+        chunks.append(BOOKING_REF_PAIRS[index])
+        total += BOOKING_REF_PAIR_WEIGHTS[index]
+    chunks.reverse()
+    chunks.append(BOOKING_REF_ALPHABET[-total % 32])
+    return ''.join(chunks)
+
+def normalize_booking_reference(reference):
+    """Uppercase a typed reference, mapping O/I/L to 0/1/1 for references in the current format"""
+    reference = (reference or '').strip().upper()
+    if len(reference) == BOOKING_REF_LENGTH:
+        reference = reference.translate(BOOKING_REF_ALIASES)
+    return reference
+
+def booking_reference_looks_valid(reference):
+    """Check a normalized reference without touching the database.
+
+    References in the current format must carry a correct check character;
+    older 10-character references have none and are left to the lookup.
+    """
+    if len(reference) != BOOKING_REF_LENGTH:
+        return re.fullmatch(r'[A-Z0-9]{10}', reference) is not None
+    if any(char not in BOOKING_REF_ALPHABET for char in reference):
+        return False
+    return booking_reference_check_char(reference[:-1]) == reference[-1]
+
+# Event dashboard stats
+def ensure_event_stats():
+    """Create the event_stats table and fill it from the existing tickets and payments"""
+    EventStats.__table__.create(db.session.connection(), checkfirst=True)
+    rebuild_event_stats()
+
+def rebuild_event_stats():
+    """Recompute every event's counters from the ticket and payment tables, in the current transaction"""
+    db.session.execute(text('DELETE FROM event_stats'))
+    db.session.execute(text(
+        "INSERT INTO event_stats (event_id, total_tickets, confirmed_tickets, pending_payments, revenue) "
+        "SELECT event.id, COALESCE(t.total_tickets, 0), COALESCE(t.confirmed_tickets, 0), "
+        "COALESCE(p.pending_payments, 0), COALESCE(t.revenue, 0) FROM event "
+        "LEFT JOIN (SELECT event_id, SUM(payment_status != 'expired') AS total_tickets, "
+        "SUM(payment_status = 'paid') AS confirmed_tickets, "
+        "SUM(CASE WHEN payment_status = 'paid' THEN total_price ELSE 0 END) AS revenue "
+        "FROM ticket GROUP BY event_id) t ON t.event_id = event.id "
+        "LEFT JOIN (SELECT ticket.event_id, COUNT(*) AS pending_payments FROM payment "
+        "JOIN ticket ON ticket.id = payment.ticket_id WHERE payment.status = 'pending' "
+        "GROUP BY ticket.event_id) p ON p.event_id = event.id"
+    ))
+
+def bump_event_stats(event_id, **deltas):
+    """Add deltas to an event's counters in the current transaction, creating its row if needed.
+
+    The event's stream subscribers get the deltas and the new totals on commit.
+    """
+    statement = sqlite_insert(EventStats).values(event_id=event_id, **deltas)
+    statement = statement.on_conflict_do_update(
+        index_elements=['event_id'],
+        set_={name: getattr(EventStats, name) + statement.excluded[name] for name in deltas}
+    ).returning(
+        EventStats.total_tickets, EventStats.confirmed_tickets,
+        EventStats.pending_payments, EventStats.revenue
+    )
+    totals = db.session.execute(statement).one()
+    queue_notification(f'event:{event_id}', 'event_stats', {
+        'event_id': event_id,
+        'deltas': deltas,
+        'total_tickets': totals.total_tickets,
+        'confirmed_tickets': totals.confirmed_tickets,
+        'pending_payments': totals.pending_payments,
+        'revenue': totals.revenue
+    })
+
+def transition_payment(payment, status):
+    """Move a payment to a new status, returning its previous status.
+
+    Returns None if a concurrent request changed the payment first, so the
+    caller never applies the same counter deltas twice.
+    """
+    previous = payment.status
+    changed = db.session.execute(db.update(Payment).where(
+        Payment.id == payment.id,
+        Payment.status == previous
+    ).values(status=status)).rowcount
+    return previous if changed else None
+
+def apply_payment_action(rows, action):
+    """Confirm or reject pending payments with set-based statements, without committing.
+
+    Each row must carry id, ticket_id, event_id, attendee_id, payment_status
+    and total_price. Only payments still pending at write time are moved, so
+    concurrent requests cannot double-apply; the rows actually updated
+    are returned.
+    """
+    if not rows:
+        return []
+    
+    now = datetime.utcnow()
+    payment_values = {'status': 'confirmed' if action == 'confirm' else 'rejected'}
+    if action == 'confirm':
+        payment_values['confirmed_at'] = now
+    updated_ids = set(db.session.execute(db.update(Payment).where(
+        Payment.id.in_([row.id for row in rows]),
+        Payment.status == 'pending'
+    ).values(**payment_values).returning(Payment.id)).scalars().all())
+    
+    updated = [row for row in rows if row.id in updated_ids]
+    if not updated:
+        return []
+    
+    if action == 'confirm':
+        # ticket_qr_url, built in SQL for every ticket in the batch
+        ticket_values = {'payment_status': 'paid', 'qr_status': 'queued',
+                         'qr_code_path': '/api/tickets/' + Ticket.booking_reference + '/qr'}
+    else:
+        ticket_values = {
+            'payment_status': 'unpaid',
+            'hold_expires_at': now + timedelta(minutes=TICKET_HOLD_MINUTES)
+        }
+    db.session.execute(
+        db.update(Ticket).where(Ticket.id.in_([row.ticket_id for row in updated])).values(**ticket_values),
+        execution_options={'synchronize_session': False}
+    )
+    for row in updated:
+        notify_ticket_status(row.attendee_id, row.ticket_id, ticket_values['payment_status'])
+        notify_payment_resolved(row.event_id, row.id, payment_values['status'])
+    
+    # Fold the counter changes into one upsert per event
+    deltas_by_event = {}
+    for row in updated:
+        deltas = deltas_by_event.setdefault(row.event_id, {
+            'pending_payments': 0, 'confirmed_tickets': 0, 'revenue': 0.0
+        })
+        deltas['pending_payments'] -= 1
+        if action == 'confirm' and row.payment_status != 'paid':
+            deltas['confirmed_tickets'] += 1
+            deltas['revenue'] += row.total_price
+        elif action == 'reject' and row.payment_status == 'paid':
+            deltas['confirmed_tickets'] -= 1
+            deltas['revenue'] -= row.total_price
+    for event_id, deltas in deltas_by_event.items():
+        bump_event_stats(event_id, **deltas)
+    
+    return updated
+
+# M-PESA statement reconciliation
+def normalize_payment_reference(reference):
+    """Reduce a payment reference to the form used for matching statement lines"""
+    return re.sub(r'[^A-Z0-9]', '', (reference or '').upper())
+
+def ensure_reference_keys():
+    """Add and backfill payment.reference_key for databases created before it existed"""
+    add_column_if_missing('payment', 'reference_key', 'VARCHAR(100)')
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_payment_reference_key ON payment (reference_key)'))
+    while True:
+        rows = db.session.execute(text(
+            'SELECT id, payment_reference FROM payment WHERE reference_key IS NULL LIMIT 1000'
+        )).all()
+        if not rows:
+            break
+        db.session.execute(text('UPDATE payment SET reference_key = :key WHERE id = :id'), [
+            {'id': row.id, 'key': normalize_payment_reference(row.payment_reference)} for row in rows
+        ])
+
+def find_statement_column(fieldnames, candidates):
+    """Return the statement header matching one of the candidate names, if any"""
+    for name in fieldnames or []:
+        if name and name.strip().lower() in candidates:
+            return name
+    return None
+
+def parse_statement_amount(value):
+    """Parse a statement amount such as '1,500.00', returning None if blank or invalid"""
+    try:
+        return float((value or '').replace(',', '').strip())
+    except ValueError:
+        return None
+
+def reconcile_statement_batch(lines, organizer_id, report, matched_codes):
+    """Match one batch of (line number, code key, amount) statement lines and confirm exact matches"""
+    query = db.session.query(
+        Payment.id,
+        Payment.reference_key,
+        Payment.amount,
+        Ticket.id.label('ticket_id'),
+        Ticket.event_id,
+        Ticket.attendee_id,
+        Ticket.payment_status,
+        Ticket.total_price
+    ).join(Ticket, Ticket.id == Payment.ticket_id).join(
+        Event, Event.id == Ticket.event_id
+    ).filter(
+        Payment.status == 'pending',
+        Payment.reference_key.in_({code_key for _, code_key, _ in lines})
+    )
+    if organizer_id is not None:
+        query = query.filter(Event.organizer_id == organizer_id)
+    
+    pending_by_key = {}
+    for row in query:
+        pending_by_key.setdefault(row.reference_key, []).append(row)
+    
+    to_confirm = []
+    for line_number, code_key, amount in lines:
+        if code_key in matched_codes:
+            report['mismatches'].append({'line': line_number, 'transaction_code': code_key,
+                                         'reason': 'duplicate_transaction'})
+            continue
+        candidates = pending_by_key.get(code_key)
+        if not candidates:
+            report['unmatched'] += 1
+            continue
+        
+        # Everything claiming this code is settled by this line, one way or another
+        del pending_by_key[code_key]
+        matched_codes.add(code_key)
+        if len(candidates) > 1:
+            report['mismatches'].append({'line': line_number, 'transaction_code': code_key,
+                                         'reason': 'duplicate_reference',
+                                         'payment_ids': [row.id for row in candidates]})
+        elif abs(candidates[0].amount - amount) > 0.005:
+            report['mismatches'].append({'line': line_number, 'transaction_code': code_key,
+                                         'reason': 'amount_mismatch', 'payment_id': candidates[0].id,
+                                         'expected': candidates[0].amount, 'received': amount})
+        else:
+            to_confirm.append(candidates[0])
+    
+    confirmed = apply_payment_action(to_confirm, 'confirm')
+    db.session.commit()
+    queue_qr_renders([row.ticket_id for row in confirmed])
+    report['confirmed'] += len(confirmed)
+    report['confirmed_payment_ids'].extend(row.id for row in confirmed)
+
+# Event exports
+def build_export_query(export_type, event_id, archived=False):
+    """Select just the exported columns, in a stable order"""
+    ticket, payment = (ArchivedTicket, ArchivedPayment) if archived else (Ticket, Payment)
+    if export_type == 'attendees':
+        return db.select(
+            ticket.id.label('ticket_id'),
+            ticket.booking_reference,
+            User.name.label('attendee_name'),
+            User.email.label('attendee_email'),
+            ticket.quantity,
+            ticket.total_price,
+            ticket.payment_status,
+            ticket.is_checked_in,
+            ticket.checked_in_at,
+            ticket.created_at
+        ).join(User, User.id == ticket.attendee_id).where(
+            ticket.event_id == event_id
+        ).order_by(ticket.id)
+    return db.select(
+        payment.id.label('payment_id'),
+        ticket.id.label('ticket_id'),
+        ticket.booking_reference,
+        User.name.label('attendee_name'),
+        User.email.label('attendee_email'),
+        payment.amount,
+        payment.payment_method,
+        payment.payment_reference,
+        payment.status,
+        payment.created_at,
+        payment.confirmed_at
+    ).join(ticket, ticket.id == payment.ticket_id).join(User, User.id == ticket.attendee_id).where(
+        ticket.event_id == event_id
+    ).order_by(payment.id)
+
+def export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def export_csv_rows(result):
+    """Yield CSV text one fetched batch at a time, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(result.keys())
+    for batch in result.partitions():
+        for row in batch:
+            writer.writerow([export_value(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_ndjson_rows(result):
+    """Yield newline-delimited JSON objects one fetched batch at a time"""
+    columns = list(result.keys())
+    for batch in result.partitions():
+        yield ''.join(
+            json.dumps(dict(zip(columns, (export_value(value) for value in row)))) + '\n'
+            for row in batch
+        )
+
+# Gate check-in
+def parse_ticket_qr_payload(qr_data):
+    """Split a TikoZetu|ref|event|attendee|qty payload, raising ValueError if malformed"""
+    parts = (qr_data or '').strip().split('|')
+    if len(parts) != 5 or parts[0] != 'TikoZetu' or not parts[1]:
+        raise ValueError('Not a TikoZetu ticket code')
+    try:
+        return parts[1], int(parts[2]), int(parts[3]), int(parts[4])
+    except ValueError:
+        raise ValueError('Not a TikoZetu ticket code')
+
+# QR code rendering
+_qr_executor = None
+
+QR_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+qr_cache = LRUCache(QR_CACHE_MAX_BYTES)
+
+def ensure_qr_schema():
+    """Add the qr_status column to databases created before it existed"""
+    if add_column_if_missing('ticket', 'qr_status', 'VARCHAR(20)'):
+        db.session.execute(text(
+            "UPDATE ticket SET qr_status = CASE WHEN qr_code_path IS NOT NULL THEN 'ready' "
+            "WHEN payment_status = 'paid' THEN 'queued' END"
+        ))
+
+def fill_ticket_qr_paths():
+    """Point every paid ticket at its QR endpoint, including ones whose background render was lost"""
+    db.session.execute(text(
+        "UPDATE ticket SET qr_code_path = '/api/tickets/' || booking_reference || '/qr' "
+        "WHERE payment_status = 'paid' AND qr_code_path IS NULL"
+    ))
+
+def ticket_qr_payload(ticket):
+    """Return the data encoded in a ticket's QR code"""
+    return f"TikoZetu|{ticket.booking_reference}|{ticket.event_id}|{ticket.attendee_id}|{ticket.quantity}"
+
+def ticket_qr_url(booking_ref):
+    return f'/api/tickets/{booking_ref}/qr'
+
+def render_qr_image(qr_data, image_format='png'):
+    """Render a QR code as SVG or 1-bit PNG bytes. Safe to run in a worker process."""
+    # Imported here so only processes that render QR codes pay for the import
+    import qrcode
+    qr = qrcode.QRCode(border=QR_BORDER, mask_pattern=QR_MASK_PATTERN)
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    
+    if image_format == 'svg':
+        return qr_matrix_to_svg(qr.get_matrix())
+    return qr_matrix_to_png(qr.get_matrix(), QR_BOX_SIZE)
+
+def qr_matrix_to_png(matrix, box_size):
+    """Encode a QR module matrix as a 1-bit greyscale PNG"""
+    width = len(matrix) * box_size
+    raw = bytearray()
+    for row in matrix:
+        # Dark modules are 0 bits; pad each scanline to a whole byte
+        bits = ''.join(('0' if module else '1') * box_size for module in row)
+        bits += '0' * (-len(bits) % 8)
+        scanline = b'\x00' + int(bits, 2).to_bytes(len(bits) // 8, 'big')
+        raw += scanline * box_size
+    
+    def chunk(chunk_type, data):
+        return (struct.pack('>I', len(data)) + chunk_type + data
+                + struct.pack('>I', zlib.crc32(chunk_type + data)))
+    
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, width, 1, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(bytes(raw), 9))
+            + chunk(b'IEND', b''))
+
+def qr_matrix_to_svg(matrix):
+    """Draw a QR module matrix as a single SVG path of horizontal runs"""
+    size = len(matrix)
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            runs.append(f'M{start} {y}h{x - start}v1h-{x - start}z')
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/><path d="{"".join(runs)}"/></svg>'
+    ).encode()
+
+def get_qr_image(qr_data, image_format):
+    """Return rendered QR bytes, from the cache when possible"""
+    key = (image_format, qr_data)
+    data = qr_cache.get(key)
+    if data is None:
+        data = render_qr_image(qr_data, image_format)
+        qr_cache.put(key, data)
+    return data
+
+def get_qr_executor():
+    """Return the process pool used for QR rendering, creating it on first use"""
+    global _qr_executor
+    if _qr_executor is None:
+        from concurrent.futures import ProcessPoolExecutor
+        _qr_executor = ProcessPoolExecutor(max_workers=QR_RENDER_WORKERS)
+    return _qr_executor
+
+def queue_qr_render(ticket):
+    """Pre-render the QR code for a paid ticket in the background.
+
+    Call after the ticket has been committed as paid, which already sets its
+    qr_code_path: the QR endpoint renders on demand, so a render lost with
+    its worker only costs the first view. The worker's PNG warms the QR
+    cache and qr_status records how the pre-render went.
+    """
+    app = current_app._get_current_object()
+    ticket_id = ticket.id
+    attendee_id = ticket.attendee_id
+    booking_ref = ticket.booking_reference
+    qr_data = ticket_qr_payload(ticket)
+    try:
+        future = get_qr_executor().submit(render_qr_image, qr_data)
+    except Exception as e:
+        # No worker processes here (e.g. serverless); the endpoint renders on first view
+        print(f"QR pre-render unavailable, serving ticket {ticket_id} on demand: {e}")
+        db.session.execute(db.update(Ticket).where(Ticket.id == ticket_id).values(qr_status='ready'))
+        notify_qr_status(attendee_id, ticket_id, 'ready', ticket_qr_url(booking_ref))
+        db.session.commit()
+        return
+    future.add_done_callback(lambda done: finish_qr_render(app, ticket_id, attendee_id, booking_ref, qr_data, done))
+
+def notify_qr_status(attendee_id, ticket_id, qr_status, qr_code_path=None):
+    queue_notification(f'user:{attendee_id}', 'ticket_qr', {
+        'ticket_id': ticket_id, 'qr_status': qr_status, 'qr_code_path': qr_code_path
+    })
+
+def finish_qr_render(app, ticket_id, attendee_id, booking_ref, qr_data, future):
+    """Record the outcome of a background QR render on its ticket"""
+    with app.app_context():
+        try:
+            qr_cache.put(('png', qr_data), future.result())
+            qr_status = 'ready'
+        except Exception as e:
+            print(f"QR code rendering failed for ticket {ticket_id}: {e}")
+            qr_status = 'failed'
+        db.session.execute(db.update(Ticket).where(Ticket.id == ticket_id).values(qr_status=qr_status))
+        notify_qr_status(attendee_id, ticket_id, qr_status, ticket_qr_url(booking_ref))
+        db.session.commit()
+
+def queue_qr_renders(ticket_ids):
+    """Queue background QR renders for a batch of committed, paid tickets"""
+    if ticket_ids:
+        # Plain rows rather than ORM objects, so large batches do not fill the session
+        tickets = db.session.query(
+            Ticket.id, Ticket.booking_reference, Ticket.event_id, Ticket.attendee_id, Ticket.quantity
+        ).filter(Ticket.id.in_(ticket_ids))
+        for ticket in tickets:
+            queue_qr_render(ticket)
+
+def requeue_pending_qr_codes():
+    """Re-warm the renders that were lost when the previous process stopped"""
+    for ticket in Ticket.query.filter_by(qr_status='queued').all():
+        queue_qr_render(ticket)
+
+def ensure_payment_indexes():
+    """Create the indexes behind the organizer pending-payments queue"""
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_payment_status_ticket_id ON payment (status, ticket_id)'))
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_ticket_event_id ON ticket (event_id)'))
+
+# Event search index
+_search_index_ready = None
+
+def ensure_event_indexes():
+    """Create the keyset index and the FTS5 search index over events"""
+    global _search_index_ready
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_event_date_id ON event (date, id)'))
+    if db.engine.dialect.name != 'sqlite':
+        _search_index_ready = False
+        return
+    
+    exists = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_fts'"
+    )).first()
+    
+    # External-content FTS table; the triggers keep it in sync with every
+    # write to event, including the inserts made by create_event
+    db.session.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS event_fts USING fts5("
+        "title, description, location, category, content='event', content_rowid='id')"
+    ))
+    db.session.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS event_fts_ai AFTER INSERT ON event BEGIN "
+        "INSERT INTO event_fts(rowid, title, description, location, category) "
+        "VALUES (new.id, new.title, new.description, new.location, new.category); END"
+    ))
+    db.session.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS event_fts_ad AFTER DELETE ON event BEGIN "
+        "INSERT INTO event_fts(event_fts, rowid, title, description, location, category) "
+        "VALUES ('delete', old.id, old.title, old.description, old.location, old.category); END"
+    ))
+    db.session.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS event_fts_au AFTER UPDATE OF title, description, location, category "
+        "ON event BEGIN "
+        "INSERT INTO event_fts(event_fts, rowid, title, description, location, category) "
+        "VALUES ('delete', old.id, old.title, old.description, old.location, old.category); "
+        "INSERT INTO event_fts(rowid, title, description, location, category) "
+        "VALUES (new.id, new.title, new.description, new.location, new.category); END"
+    ))
+    if not exists:
+        # Index the events that were created before the search index existed
+        db.session.execute(text("INSERT INTO event_fts(event_fts) VALUES ('rebuild')"))
+    _search_index_ready = True
+
+def search_index_available():
+    """Return True if the FTS5 event index exists in this database"""
+    global _search_index_ready
+    if _search_index_ready is None:
+        _search_index_ready = db.engine.dialect.name == 'sqlite' and db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_fts'"
+        )).first() is not None
+    return _search_index_ready
+
+def build_fts_query(search_term):
+    """Turn free text into an FTS5 query of prefix-matched, quoted terms"""
+    terms = re.findall(r'\w+', search_term.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def apply_event_search(query, search_term, source=Event):
+    """Restrict an Event (or ArchivedEvent) query to rows matching the search term"""
+    # The archive has no full-text index
+    if source is Event and search_index_available():
+        fts_query = build_fts_query(search_term)
+        # A term of only punctuation has no words to match, so nothing matches it
+        if not fts_query:
+            return query.filter(false())
+        return query.filter(text(
+            'event.id IN (SELECT rowid FROM event_fts WHERE event_fts MATCH :fts_query)'
+        ).bindparams(fts_query=fts_query))
+    
+    pattern = f'%{search_term}%'
+    return query.filter(or_(
+        source.title.ilike(pattern),
+        source.description.ilike(pattern),
+        source.location.ilike(pattern),
+        source.category.ilike(pattern)
+    ))
+
+def encode_cursor(position_date, position_id):
+    """Encode a (timestamp, id) keyset position as an opaque cursor"""
+    raw = f'{position_date.isoformat()}|{position_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising ValueError if invalid"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_date, raw_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(raw_date), int(raw_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def parse_limit_arg(default, maximum):
+    """Read the limit query argument, clamped to [1, maximum]"""
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+def parse_date_arg(name):
+    """Parse an optional ISO date query argument, raising ValueError if invalid"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f'Invalid date for {name}')
+
+# Ordered schema migrations; append new steps, never reorder or remove them
+def narrow_event_search_trigger():
+    """Only re-index an event when a searchable column changes, not on every seat sold"""
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text('DROP TRIGGER IF EXISTS event_fts_au'))
+        ensure_event_indexes()
+
+def add_ticket_wallet_index():
+    """Add ticket.updated_at and replace the attendee index with one that also orders by created_at"""
+    add_column_if_missing('ticket', 'updated_at', 'DATETIME')
+    db.session.execute(text('UPDATE ticket SET updated_at = created_at WHERE updated_at IS NULL'))
+    db.session.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_ticket_attendee_created ON ticket (attendee_id, created_at)'
+    ))
+    db.session.execute(text('DROP INDEX IF EXISTS ix_ticket_attendee_id'))
+
+def add_payment_uniqueness():
+    """Create the idempotency key table and the unique active-payment indexes.
+
+    Retried submissions left some tickets with several active payments, and
+    some transaction codes on several tickets. Per ticket the confirmed (else
+    the earliest) payment is kept and the rest are rejected; per code, later
+    pending payments are rejected and later confirmed ones lose their
+    reference_key. Tickets left without an active payment get a fresh hold.
+    """
+    IdempotencyKey.__table__.create(db.session.connection(), checkfirst=True)
+    
+    active = "status IN ('pending', 'confirmed')"
+    rejected = db.session.execute(text(
+        f"UPDATE payment SET status = 'rejected' WHERE id IN ("
+        f"SELECT id FROM (SELECT id, ROW_NUMBER() OVER ("
+        f"PARTITION BY ticket_id ORDER BY status = 'confirmed' DESC, id) AS position "
+        f"FROM payment WHERE {active}) WHERE position > 1)"
+    )).rowcount
+    duplicate_codes = (
+        f"SELECT id FROM (SELECT id, status, ROW_NUMBER() OVER ("
+        f"PARTITION BY reference_key ORDER BY status = 'confirmed' DESC, id) AS position "
+        f"FROM payment WHERE {active} AND reference_key != '') WHERE position > 1"
+    )
+    db.session.execute(text(f"UPDATE payment SET reference_key = '' WHERE status = 'confirmed' AND id IN ({duplicate_codes})"))
+    rejected += db.session.execute(text(f"UPDATE payment SET status = 'rejected' WHERE id IN ({duplicate_codes})")).rowcount
+    
+    if rejected:
+        db.session.execute(text(
+            f"UPDATE ticket SET payment_status = 'unpaid', hold_expires_at = :hold WHERE payment_status = 'pending' "
+            f"AND NOT EXISTS (SELECT 1 FROM payment WHERE payment.ticket_id = ticket.id AND {active})"
+        ), {'hold': datetime.utcnow() + timedelta(minutes=TICKET_HOLD_MINUTES)})
+        rebuild_event_stats()
+        print(f"Rejected {rejected} duplicate payments")
+    
+    db.session.execute(text(
+        f'CREATE UNIQUE INDEX IF NOT EXISTS ux_payment_active_ticket ON payment (ticket_id) WHERE {active}'
+    ))
+    db.session.execute(text(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ux_payment_active_reference ON payment (reference_key) "
+        f"WHERE {active} AND reference_key != ''"
+    ))
+
+def add_archive_summaries():
+    """Create the table that keeps the dashboard's view of archived events"""
+    ArchivedEventSummary.__table__.create(db.session.connection(), checkfirst=True)
+
+def add_autoincrement_ids():
+    """Rebuild the archived tables with AUTOINCREMENT ids.
+
+    SQLite otherwise hands the ids of deleted rows out again, and the archive
+    deletes the highest ids as readily as any. Each table is copied into one
+    declared by its model, keeping its indexes, and its sequence starts past
+    the highest id in either database.
+    """
+    # Migrations run inside a transaction, where SQLite cannot attach the
+    # archive; read its highest ids over a connection of its own
+    archived_ids = {}
+    path = archive_database_path()
+    if path and os.path.exists(path):
+        with closing(sqlite3.connect(path)) as archive:
+            present = {row[0] for row in archive.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            archived_ids = {name: archive.execute(f'SELECT MAX(id) FROM {name}').fetchone()[0] or 0
+                            for name in archive_tables if name in present}
+    for name in archive_tables:
+        table_sql = db.session.execute(text(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': name}).scalar()
+        if 'AUTOINCREMENT' not in table_sql.upper():
+            index_sql = db.session.execute(text(
+                "SELECT sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = :name AND sql IS NOT NULL"
+            ), {'name': name}).scalars().all()
+            existing = {row[1] for row in db.session.execute(text(f'PRAGMA main.table_info({name})'))}
+            columns = ', '.join(f'"{column.name}"' for column in db.metadata.tables[name].columns
+                                if column.name in existing)
+            create = str(CreateTable(db.metadata.tables[name]).compile(dialect=db.engine.dialect))
+            db.session.execute(text(create.replace(f'CREATE TABLE {name} ', f'CREATE TABLE main.{name}_rebuilt ', 1)))
+            db.session.execute(text(f'INSERT INTO main.{name}_rebuilt ({columns}) SELECT {columns} FROM main.{name}'))
+            db.session.execute(text(f'DROP TABLE main.{name}'))
+            db.session.execute(text(f'ALTER TABLE main.{name}_rebuilt RENAME TO {name}'))
+            for sql in index_sql:
+                db.session.execute(text(sql))
+        
+        seq = max(archived_ids.get(name, 0), db.session.execute(text(
+            f'SELECT MAX(COALESCE((SELECT MAX(id) FROM main.{name}), 0), '
+            f'COALESCE((SELECT seq FROM main.sqlite_sequence WHERE name = :name), 0))'
+        ), {'name': name}).scalar())
+        db.session.execute(text('DELETE FROM main.sqlite_sequence WHERE name = :name'), {'name': name})
+        db.session.execute(text('INSERT INTO main.sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                           {'name': name, 'seq': seq})
+    # Dropping the old event table took the search index triggers with it
+    ensure_event_indexes()
+
+def add_hold_sweep_index():
+    """Index the unpaid holds and stop counting expired tickets in the dashboard totals"""
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_ticket_unpaid_hold ON ticket (hold_expires_at) WHERE payment_status = 'unpaid'"
+    ))
+    rebuild_event_stats()
+
+SCHEMA_MIGRATIONS = [
+    create_base_schema,
+    ensure_inventory_schema,
+    ensure_qr_schema,
+    ensure_event_stats,
+    ensure_reference_keys,
+    ensure_event_indexes,
+    ensure_payment_indexes,
+    add_lookup_indexes,
+    narrow_event_search_trigger,
+    add_ticket_wallet_index,
+    add_payment_uniqueness,
+    add_archive_summaries,
+    fill_ticket_qr_paths,
+    add_autoincrement_ids,
+    add_hold_sweep_index,
+]
+
+# Hot/cold archive
+# Rows of each archived table that belong to the events in :ids
+ARCHIVE_ROW_FILTERS = {
+    'event': 'id IN :ids',
+    'event_payment': 'event_id IN :ids',
+    'ticket': 'event_id IN :ids',
+    'payment': 'ticket_id IN (SELECT id FROM main.ticket WHERE event_id IN :ids)',
+}
+# A column that tells one row from another row with the same id, and how a
+# live row (aliased "live") leads back to its event
+ARCHIVE_ROW_IDENTITY = {
+    'event': ('created_at', 'live.id'),
+    'event_payment': ('event_id', 'live.event_id'),
+    'ticket': ('booking_reference', 'live.event_id'),
+    'payment': ('ticket_id', '(SELECT event_id FROM main.ticket WHERE ticket.id = live.ticket_id)'),
+}
+
+def archive_database_path():
+    """Return the archive's file path, or None if the main database is not a SQLite file"""
+    if ARCHIVE_PATH:
+        return ARCHIVE_PATH
+    main = db.engine.url.database
+    if db.engine.dialect.name != 'sqlite' or not main or main == ':memory:':
+        return None
+    root, extension = os.path.splitext(main)
+    return f'{root}-archive{extension or ".db"}'
+
+def attach_archive(create=False):
+    """Attach the archive to the session's connection as schema "archive".
+
+    Returns False if there is no archive yet (and create is False). SQLite
+    cannot attach inside a transaction, so call this before the session's
+    first write. The session keeps the connection until it commits; the
+    attachment stays with the pooled connection after that.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    if any(row[1] == 'archive' for row in db.session.execute(text('PRAGMA database_list'))):
+        return True
+    path = archive_database_path()
+    if path is None or not (create or os.path.exists(path)):
+        return False
+    db.session.execute(text('ATTACH DATABASE :path AS archive'), {'path': path})
+    return True
+
+def ensure_archive_schema():
+    """Create the archive's tables and indexes, adding columns the live tables have gained"""
+    connection = db.session.connection()
+    db.session.execute(text('PRAGMA archive.journal_mode=WAL'))
+    for name, table in archive_tables.items():
+        table.create(connection, checkfirst=True)
+        existing = {row[1] for row in db.session.execute(text(f'PRAGMA archive.table_info({name})'))}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                db.session.execute(text(f'ALTER TABLE archive.{name} ADD COLUMN "{column.name}" {column_type}'))
+    db.session.commit()
+
+def archive_conflicts(ids):
+    """Return the events in ids with a row whose id the archive already holds for a different row.
+
+    Only ids SQLite reused before add_autoincrement_ids can collide like this.
+    """
+    conflicts = set()
+    for name, (identity, event_id) in ARCHIVE_ROW_IDENTITY.items():
+        conflicts.update(db.session.execute(text(
+            f'SELECT DISTINCT {event_id} FROM main.{name} AS live JOIN archive.{name} AS archived '
+            f'ON archived.id = live.id WHERE {event_id} IN :ids AND archived.{identity} IS NOT live.{identity}'
+        ).bindparams(db.bindparam('ids', expanding=True)), {'ids': ids}).scalars())
+    return conflicts
+
+def archive_rows_statement(name, changed_only=False):
+    """Copy the live rows of the events in :ids into the archive.
+
+    A row the archive already holds is only updated if it is the same row,
+    left there by an interrupted run; a different row under the same id is
+    never overwritten.
+    """
+    column_names = [column.name for column in archive_tables[name].columns]
+    columns = ', '.join(f'"{column}"' for column in column_names)
+    where = ARCHIVE_ROW_FILTERS[name]
+    identity = ARCHIVE_ROW_IDENTITY[name][0]
+    sql = f'INSERT INTO archive.{name} ({columns}) SELECT {columns} FROM main.{name} WHERE {where}'
+    if changed_only:
+        sql += f' EXCEPT SELECT {columns} FROM archive.{name} WHERE {where}'
+    sql += (
+        ' ON CONFLICT (id) DO UPDATE SET '
+        + ', '.join(f'"{column}" = excluded."{column}"' for column in column_names if column != 'id')
+        + f' WHERE {name}.{identity} IS excluded.{identity}'
+    )
+    return text(sql).bindparams(db.bindparam('ids', expanding=True))
+
+def archive_past_events(cutoff, batch_rows=ARCHIVE_BATCH_ROWS):
+    """Move events dated before cutoff, with their tickets and payments, to the archive.
+
+    Each batch is copied to the archive first, without holding up writers to
+    the live tables. A second transaction copies anything changed since,
+    leaves an ArchivedEventSummary per event and deletes the live rows. A
+    run stopped between the two leaves rows in both databases, and the next
+    run finishes the move. Events with payments still awaiting the organizer
+    are left alone, as are events with rows whose ids the archive already
+    holds for other rows. Returns counts of what was moved and skipped.
+    """
+    db.session.commit()
+    if not attach_archive(create=True):
+        raise RuntimeError('Archiving needs a file-backed SQLite database')
+    ensure_archive_schema()
+    
+    counts = Counter(events=0, tickets=0, payments=0)
+    conflicts = set()
+    while True:
+        # Each commit hands the connection back to the pool; make sure the next one has the archive
+        attach_archive()
+        candidates = db.session.execute(text(
+            "SELECT event.id, COALESCE(event_stats.total_tickets, 0) AS tickets FROM main.event "
+            "LEFT JOIN main.event_stats ON event_stats.event_id = event.id "
+            "WHERE event.date < :cutoff AND NOT EXISTS (SELECT 1 FROM main.ticket "
+            "JOIN main.payment ON payment.ticket_id = ticket.id "
+            "WHERE ticket.event_id = event.id AND payment.status = 'pending') "
+            "AND event.id NOT IN :conflicts ORDER BY event.date, event.id LIMIT :limit"
+        ).bindparams(db.bindparam('conflicts', expanding=True)),
+            {'cutoff': cutoff, 'conflicts': list(conflicts), 'limit': batch_rows}).all()
+        if not candidates:
+            break
+        ids, rows = [], 0
+        for event_id, tickets in candidates:
+            if ids and rows + tickets > batch_rows:
+                break
+            ids.append(event_id)
+            rows += tickets
+        params = {'ids': ids}
+        clashing = archive_conflicts(ids)
+        if clashing:
+            conflicts.update(clashing)
+            continue
+        
+        for name in ARCHIVE_ROW_FILTERS:
+            db.session.execute(archive_rows_statement(name), params)
+        db.session.commit()
+        
+        attach_archive()
+        for name in ARCHIVE_ROW_FILTERS:
+            db.session.execute(archive_rows_statement(name, changed_only=True), params)
+        db.session.execute(text(
+            "INSERT OR REPLACE INTO main.archived_event_summary (event_id, organizer_id, title, date, "
+            "total_tickets, confirmed_tickets, pending_payments, revenue, archived_at) "
+            "SELECT event.id, event.organizer_id, event.title, event.date, COALESCE(stats.total_tickets, 0), "
+            "COALESCE(stats.confirmed_tickets, 0), COALESCE(stats.pending_payments, 0), "
+            "COALESCE(stats.revenue, 0), :now FROM main.event "
+            "LEFT JOIN main.event_stats AS stats ON stats.event_id = event.id WHERE event.id IN :ids"
+        ).bindparams(db.bindparam('ids', expanding=True)), {**params, 'now': datetime.utcnow()})
+        for name, counter in [('payment', 'payments'), ('ticket', 'tickets'), ('event_payment', None),
+                              ('event_stats', None), ('event', 'events')]:
+            where = ARCHIVE_ROW_FILTERS.get(name, 'event_id IN :ids')
+            deleted = db.session.execute(
+                text(f'DELETE FROM main.{name} WHERE {where}').bindparams(db.bindparam('ids', expanding=True)),
+                params
+            ).rowcount
+            if counter:
+                counts[counter] += deleted
+        db.session.commit()
+    
+    counts['skipped'] = db.session.execute(text(
+        "SELECT COUNT(DISTINCT ticket.event_id) FROM main.ticket JOIN main.payment ON payment.ticket_id = ticket.id "
+        "JOIN main.event ON event.id = ticket.event_id WHERE event.date < :cutoff AND payment.status = 'pending'"
+    ), {'cutoff': cutoff}).scalar()
+    counts['conflicts'] = len(conflicts)
+    return counts
+
+# Authentication
+class TokenBucketLimiter:
+    """In-memory token buckets, one per key, holding at most max_keys buckets"""
+    
+    def __init__(self, capacity, per_minute, max_keys=100000):
+        self.capacity = capacity
+        self.refill_rate = per_minute / 60.0
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def consume(self, key):
+        """Take a token for key. Returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                # Least recently seen keys go first; their buckets have refilled anyway
+                self._buckets.popitem(last=False)
+            return 0 if allowed else (1 - tokens) / self.refill_rate
+
+login_ip_limiter = TokenBucketLimiter(*LOGIN_LIMIT_PER_IP)
+login_email_limiter = TokenBucketLimiter(*LOGIN_LIMIT_PER_EMAIL)
+register_ip_limiter = TokenBucketLimiter(*REGISTER_LIMIT_PER_IP)
+
+_hash_executor = None
+_hash_slots = threading.BoundedSemaphore(AUTH_HASH_WORKERS + AUTH_HASH_QUEUE)
+
+class AuthBusyError(Exception):
+    """Raised when the password hashing pool is saturated"""
+
+def get_hash_executor():
+    """Return the password hashing pool, creating it on first use.
+
+    Under gevent workers the threading module is patched to greenlets, which
+    would run the hash on the event loop and stall every open stream; gevent's
+    own executor keeps it on native threads.
+    """
+    global _hash_executor
+    if _hash_executor is None:
+        executor_class = ThreadPoolExecutor
+        if 'gevent' in sys.modules:
+            from gevent import monkey
+            if monkey.is_module_patched('threading'):
+                from gevent.threadpool import ThreadPoolExecutor as executor_class
+        _hash_executor = executor_class(max_workers=AUTH_HASH_WORKERS, thread_name_prefix='auth-hash')
+    return _hash_executor
+
+def run_password_work(func, *args):
+    """Run a password hash or check on the bounded hashing pool.
+
+    Raises AuthBusyError when the pool is full, or too far behind to answer
+    within AUTH_HASH_TIMEOUT.
+    """
+    if not _hash_slots.acquire(blocking=False):
+        raise AuthBusyError()
+    try:
+        return get_hash_executor().submit(func, *args).result(timeout=AUTH_HASH_TIMEOUT)
+    except TimeoutError:
+        raise AuthBusyError()
+    finally:
+        _hash_slots.release()
+
+def hash_password(password):
+    return run_password_work(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+def password_needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
+
+def rate_limited(retry_after):
+    response = jsonify({'error': 'Too many attempts. Please try again later.'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response
+
+def auth_busy():
+    response = jsonify({'error': 'Server is busy. Please try again shortly.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+# Idempotent retries
+_idempotency_purged_at = 0.0
+
+def idempotent(view):
+    """Replay the stored response when a write is retried with the same Idempotency-Key.
+
+    The key is claimed inside the view's own transaction, and the view ends
+    with commit_response(), which stores its response on the key in that
+    same commit. A retry racing the original waits for it and never writes
+    twice, and a process that dies after committing still leaves the
+    response to replay. Only 2xx responses are kept, so a failed attempt
+    leaves the key free. Requests without the header are handled as before.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        client_key = request.headers.get('Idempotency-Key')
+        if client_key is None or 'user_id' not in session:
+            return view(*args, **kwargs)
+        if not 0 < len(client_key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify({'error': f'Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters'}), 400
+        
+        key = hashlib.sha256(f"{session['user_id']}:{client_key}".encode()).digest()[:16]
+        request_hash = hashlib.sha256(
+            f'{request.method} {request.path}\n'.encode() + request.get_data()
+        ).digest()[:16]
+        expires_at = datetime.utcnow() + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+        claim = sqlite_insert(IdempotencyKey).values(key=key, request_hash=request_hash, expires_at=expires_at)
+        # An expired key is taken over as if it were new
+        claim = claim.on_conflict_do_update(
+            index_elements=['key'],
+            set_={'request_hash': request_hash, 'status_code': None, 'response_body': None, 'expires_at': expires_at},
+            where=IdempotencyKey.expires_at < datetime.utcnow()
+        )
+        if not db.session.execute(claim).rowcount:
+            db.session.rollback()
+            return replay_idempotent_response(key, request_hash)
+        
+        g.idempotency_key = key
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        finally:
+            g.pop('idempotency_key', None)
+        if not 200 <= response.status_code < 300:
+            # Normally the claim was rolled back with the view's work; drop it if the view committed it
+            db.session.rollback()
+            db.session.execute(db.delete(IdempotencyKey).where(
+                IdempotencyKey.key == key,
+                IdempotencyKey.expires_at == expires_at,
+                IdempotencyKey.status_code.is_(None)
+            ))
+            db.session.commit()
+        purge_expired_idempotency_keys()
+        return response
+    return wrapper
+
+def commit_response(body, status_code=200):
+    """Commit the request's writes and return body as its JSON response.
+
+    Under @idempotent the response is stored on the claimed key in the same
+    transaction, so the write and the reply to its retries cannot part.
+    """
+    response = jsonify(body)
+    response.status_code = status_code
+    key = g.get('idempotency_key')
+    if key is not None:
+        db.session.execute(db.update(IdempotencyKey).where(IdempotencyKey.key == key).values(
+            status_code=status_code, response_body=response.get_data(as_text=True)
+        ))
+    db.session.commit()
+    return response
+
+def replay_idempotent_response(key, request_hash):
+    stored = db.session.get(IdempotencyKey, key)
+    if stored is not None and stored.request_hash != request_hash:
+        return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+    if stored is None or stored.status_code is None:
+        response = jsonify({'error': 'A request with this Idempotency-Key is still being processed'})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+    
+    response = current_app.response_class(stored.response_body, status=stored.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def purge_expired_idempotency_keys():
+    """Delete expired keys in small batches, at most once per IDEMPOTENCY_PURGE_SECONDS"""
+    global _idempotency_purged_at
+    if time.monotonic() - _idempotency_purged_at < IDEMPOTENCY_PURGE_SECONDS:
+        return
+    _idempotency_purged_at = time.monotonic()
+    while True:
+        expired = db.select(IdempotencyKey.key).where(
+            IdempotencyKey.expires_at < datetime.utcnow()
+        ).limit(IDEMPOTENCY_PURGE_BATCH)
+        deleted = db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired))).rowcount
+        db.session.commit()
+        if deleted < IDEMPOTENCY_PURGE_BATCH:
+            break
+
+# Request instrumentation
+class RouteMetrics:
+    """Per-route request, latency and SQL counters, rendered in Prometheus text format"""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._routes = {}
+        self._lock = threading.Lock()
+    
+    def record(self, route, method, status, duration, statements, sql_seconds, n_plus_one):
+        with self._lock:
+            entry = self._routes.get((route, method))
+            if entry is None:
+                entry = self._routes[(route, method)] = {
+                    'statuses': Counter(),
+                    'buckets': [0] * len(self.buckets),
+                    'duration': 0.0,
+                    'statements': 0,
+                    'sql_seconds': 0.0,
+                    'n_plus_one': 0
+                }
+            entry['statuses'][status] += 1
+            for index, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    entry['buckets'][index] += 1
+            entry['duration'] += duration
+            entry['statements'] += statements
+            entry['sql_seconds'] += sql_seconds
+            entry['n_plus_one'] += n_plus_one
+    
+    def render(self):
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                '# HELP tikozetu_http_requests_total Requests handled, by route and status.',
+                '# TYPE tikozetu_http_requests_total counter'
+            ]
+            for (route, method), entry in routes:
+                for status, count in sorted(entry['statuses'].items()):
+                    lines.append(f'tikozetu_http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+            lines += [
+                '# HELP tikozetu_http_request_duration_seconds Request latency, by route.',
+                '# TYPE tikozetu_http_request_duration_seconds histogram'
+            ]
+            for (route, method), entry in routes:
+                labels = f'route="{route}",method="{method}"'
+                total = sum(entry['statuses'].values())
+                for bound, count in zip(self.buckets, entry['buckets']):
+                    lines.append(f'tikozetu_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'tikozetu_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {total}')
+                lines.append(f'tikozetu_http_request_duration_seconds_sum{{{labels}}} {entry["duration"]:.6f}')
+                lines.append(f'tikozetu_http_request_duration_seconds_count{{{labels}}} {total}')
+            for name, key, kind, help_text in [
+                ('tikozetu_sql_statements_total', 'statements', 'counter', 'SQL statements executed, by route.'),
+                ('tikozetu_sql_duration_seconds_total', 'sql_seconds', 'counter', 'Time spent executing SQL, by route.'),
+                ('tikozetu_n_plus_one_requests_total', 'n_plus_one', 'counter',
+                 'Requests that repeated one SQL statement more than the N+1 threshold.')
+            ]:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for (route, method), entry in routes:
+                    value = entry[key]
+                    value = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(f'{name}{{route="{route}",method="{method}"}} {value}')
+        return lines
+
+route_metrics = RouteMetrics(METRICS_LATENCY_BUCKETS)
+
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    g.sql_statements = Counter()
+    g.sql_seconds = 0.0
+    g.profiler = None
+    if METRICS_PROFILE_SAMPLE_RATE and random.random() < METRICS_PROFILE_SAMPLE_RATE:
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another thread is already being profiled; skip this sample
+            return
+        g.profiler = profiler
+
+def finish_request_metrics(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    duration = time.perf_counter() - started
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+    
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    statements = g.pop('sql_statements')
+    repeated = [(count, statement) for statement, count in statements.items() if count > METRICS_N_PLUS_ONE_THRESHOLD]
+    for count, statement in repeated:
+        print(f"Possible N+1 in {request.method} {route}: statement ran {count} times: {' '.join(statement.split())[:200]}")
+    route_metrics.record(route, request.method, response.status_code, duration,
+                         sum(statements.values()), g.pop('sql_seconds'), 1 if repeated else 0)
+    
+    if profiler is not None and duration * 1000 >= METRICS_SLOW_REQUEST_MS:
+        os.makedirs(METRICS_PROFILE_DIR, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        path = os.path.join(METRICS_PROFILE_DIR, f'{request.method}_{name}_{int(time.time() * 1000)}.prof')
+        profiler.dump_stats(path)
+        print(f"Slow request profiled ({duration * 1000:.0f}ms): {path}")
+    return response
+
+def before_sql_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_started'] = time.perf_counter()
+
+def after_sql_statement(conn, cursor, statement, parameters, context, executemany):
+    # Statements outside a request (QR workers, CLI commands) are not attributed
+    if has_app_context() and 'sql_statements' in g:
+        g.sql_statements[statement] += 1
+        g.sql_seconds += time.perf_counter() - conn.info.pop('metrics_started', time.perf_counter())
+
+def install_request_metrics(app):
+    app.before_request(start_request_metrics)
+    app.after_request(finish_request_metrics)
+    # Engine listeners are process-wide; only the first app installs them
+    if not event.contains(Engine, 'after_cursor_execute', after_sql_statement):
+        event.listen(Engine, 'before_cursor_execute', before_sql_statement)
+        event.listen(Engine, 'after_cursor_execute', after_sql_statement)
 
 # Create sample data
 def create_sample_data():
@@ -106,7 +1953,7 @@ def create_sample_data():
     admin = User(
         name='Admin User',
         email='admin@tikozetu.com',
-        password=generate_password_hash('admin123'),
+        password=generate_password_hash('admin123', PASSWORD_HASH_METHOD),
         role='admin'
     )
     db.session.add(admin)
@@ -115,7 +1962,7 @@ def create_sample_data():
     organizer = User(
         name='Event Organizer',
         email='organizer@tikozetu.com',
-        password=generate_password_hash('organizer123'),
+        password=generate_password_hash('organizer123', PASSWORD_HASH_METHOD),
         role='organizer'
     )
     db.session.add(organizer)
@@ -124,7 +1971,7 @@ def create_sample_data():
     attendee = User(
         name='John Attendee',
         email='attendee@tikozetu.com',
-        password=generate_password_hash('attendee123'),
+        password=generate_password_hash('attendee123', PASSWORD_HASH_METHOD),
         role='attendee'
     )
     db.session.add(attendee)
@@ -185,16 +2032,238 @@ def create_sample_data():
     db.session.commit()
     print("Sample data created successfully!")
 
+# Synthetic data
+SEED_CATEGORIES = ['Music', 'Sports', 'Technology', 'Food & Drink', 'Arts', 'Business']
+SEED_LOCATIONS = ['Nairobi', 'Mombasa', 'Kisumu', 'Nakuru', 'Eldoret']
+# How SQLAlchemy stores DateTime columns in SQLite
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+def seed_synthetic_data(users, events, tickets, password='password123', random_seed=None):
+    """Bulk-load a synthetic dataset for load tests and capacity planning.
+
+    About 1% of users are organizers. Ticket sales follow a Zipf-like curve,
+    so a few hot events take most of them; 60% are paid, 20% have a pending
+    payment and 20% are unpaid holds. Rows are built as plain tuples in
+    batches of SEED_BATCH_SIZE and handed to the driver's executemany inside
+    one transaction, with every user sharing a single precomputed password
+    hash. Returns the number of rows inserted per table.
+    """
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    # Bypassing SQLAlchemy's per-row parameter processing means storing datetimes in its format ourselves
+    created_at = now.strftime(SQLITE_DATETIME_FORMAT)
+    connection = db.session.connection()
+    
+    def next_id(model):
+        # Explicit ids must stay past those AUTOINCREMENT has already handed out
+        highest = db.session.execute(db.select(db.func.max(model.id))).scalar() or 0
+        if model.__table__.dialect_options['sqlite']['autoincrement']:
+            highest = max(highest, db.session.execute(text(
+                'SELECT seq FROM sqlite_sequence WHERE name = :name'
+            ), {'name': model.__tablename__}).scalar() or 0)
+        return highest + 1
+    
+    def insert_batches(table, columns, rows):
+        statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= SEED_BATCH_SIZE:
+                connection.exec_driver_sql(statement, batch)
+                batch = []
+        if batch:
+            connection.exec_driver_sql(statement, batch)
+    
+    first_user = next_id(User)
+    organizer_count = max(1, users // 100)
+    password_hash = generate_password_hash(password, PASSWORD_HASH_METHOD)
+    insert_batches('user', ['id', 'name', 'email', 'password', 'role', 'created_at'], (
+        (user_id, f'Seed User {user_id}', f'seed{user_id}@example.test', password_hash,
+         'organizer' if user_id < first_user + organizer_count else 'attendee', created_at)
+        for user_id in range(first_user, first_user + users)
+    ))
+    organizer_ids = list(range(first_user, first_user + organizer_count))
+    attendee_ids = list(range(first_user + organizer_count, first_user + users)) or organizer_ids
+    
+    # Draw every ticket's event up front so capacities can cover what was sold; no events, no tickets
+    ticket_events = []
+    if events:
+        ticket_events = rng.choices(range(events), [1 / rank ** 1.1 for rank in range(1, events + 1)], k=tickets)
+    tickets = len(ticket_events)
+    sold = [0] * events
+    for index in ticket_events:
+        sold[index] += 1
+    
+    first_event = next_id(Event)
+    prices = [float(rng.choice([0, 500, 1000, 1500, 2500, 5000])) for _ in range(events)]
+    event_rows = []
+    for index in range(events):
+        capacity = sold[index] + rng.randint(0, max(10, sold[index] // 2))
+        event_date = (now + timedelta(days=rng.randint(1, 365))).strftime(SQLITE_DATETIME_FORMAT)
+        event_rows.append((
+            first_event + index, f'Seed Event {first_event + index}', 'Synthetic event for load testing',
+            rng.choice(SEED_CATEGORIES), event_date, rng.choice(SEED_LOCATIONS), prices[index],
+            capacity, capacity - sold[index], rng.choice(organizer_ids), created_at
+        ))
+    insert_batches('event', ['id', 'title', 'description', 'category', 'date', 'location', 'price',
+                             'capacity', 'tickets_remaining', 'organizer_id', 'created_at'], event_rows)
+    insert_batches('event_payment', ['event_id', 'till_number', 'payment_name', 'payment_instructions'], (
+        (first_event + index, str(rng.randint(100000, 999999)), 'Seed Events',
+         'Pay to the till number above and include your name as reference')
+        for index in range(events)
+    ))
+    
+    first_ticket = next_id(Ticket)
+    first_payment = next_id(Payment)
+    statuses = rng.choices(['paid', 'pending', 'unpaid'], [6, 2, 2], k=tickets)
+    references = [generate_booking_reference() for _ in range(tickets)]
+    attendees = rng.choices(attendee_ids, k=tickets)
+    hold_expires_at = (now + timedelta(minutes=TICKET_HOLD_MINUTES)).strftime(SQLITE_DATETIME_FORMAT)
+    insert_batches('ticket', ['id', 'event_id', 'attendee_id', 'quantity', 'total_price', 'booking_reference',
+                              'qr_code_path', 'qr_status', 'is_checked_in', 'payment_status', 'hold_expires_at', 'created_at',
+                              'updated_at'], (
+        (first_ticket + offset, first_event + index, attendee_id, 1, prices[index], references[offset],
+         ticket_qr_url(references[offset]) if status == 'paid' else None,
+         'ready' if status == 'paid' else None, False, status,
+         hold_expires_at if status == 'unpaid' else None, created_at, created_at)
+        for offset, (index, attendee_id, status) in enumerate(zip(ticket_events, attendees, statuses))
+    ))
+    
+    payment_tickets = [(offset, status) for offset, status in enumerate(statuses) if status != 'unpaid']
+    insert_batches('payment', ['id', 'ticket_id', 'amount', 'payment_method', 'payment_reference',
+                               'reference_key', 'status', 'created_at', 'confirmed_at'], (
+        (first_payment + number, first_ticket + offset, prices[ticket_events[offset]], 'MPESA',
+         f'S{first_ticket + offset:09d}', f'S{first_ticket + offset:09d}',
+         'confirmed' if status == 'paid' else 'pending', created_at, created_at if status == 'paid' else None)
+        for number, (offset, status) in enumerate(payment_tickets)
+    ))
+    
+    rebuild_event_stats()
+    db.session.commit()
+    return {'users': users, 'events': events, 'tickets': tickets, 'payments': len(payment_tickets)}
+
+@bp.cli.command('migrate')
+def migrate_command():
+    """Apply any pending schema migrations to the configured database."""
+    check_and_update_schema(sample_data=False)
+
+@bp.cli.command('seed')
+@click.option('--users', default=1000, show_default=True, help='Users to create, about 1% of them organizers')
+@click.option('--events', default=100, show_default=True, help='Events to create')
+@click.option('--tickets', default=10000, show_default=True, help='Tickets to create, skewed toward a few events')
+@click.option('--password', default='password123', show_default=True, help='Password for every seeded user')
+@click.option('--seed', 'random_seed', type=int, default=None, help='Random seed for a reproducible dataset')
+def seed_command(users, events, tickets, password, random_seed):
+    """Load a synthetic dataset into the configured database."""
+    if users < 1 or events < 1 or tickets < 0:
+        raise click.BadParameter('need at least one user and one event')
+    check_and_update_schema(sample_data=False)
+    started = time.perf_counter()
+    counts = seed_synthetic_data(users, events, tickets, password, random_seed)
+    click.echo(
+        f"Seeded {counts['users']} users, {counts['events']} events, {counts['tickets']} tickets "
+        f"and {counts['payments']} payments in {time.perf_counter() - started:.1f}s"
+    )
+
+@bp.cli.command('archive')
+@click.option('--days', default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Archive events dated more than this many days ago')
+@click.option('--batch-rows', default=ARCHIVE_BATCH_ROWS, show_default=True, help='Tickets moved per batch')
+@click.option('--every', 'every_hours', type=float, default=None,
+              help='Keep running and archive again every this many hours')
+def archive_command(days, batch_rows, every_hours):
+    """Move past events, with their tickets and payments, to the archive database."""
+    check_and_update_schema(sample_data=False)
+    while True:
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        started = time.perf_counter()
+        counts = archive_past_events(cutoff, batch_rows)
+        click.echo(
+            f"Archived {counts['events']} events, {counts['tickets']} tickets and {counts['payments']} payments "
+            f"dated before {cutoff:%Y-%m-%d} in {time.perf_counter() - started:.1f}s"
+            + (f"; {counts['skipped']} events with pending payments were left" if counts['skipped'] else '')
+            + (f"; {counts['conflicts']} events whose ids clash with archived rows were left"
+               if counts['conflicts'] else '')
+        )
+        if every_hours is None:
+            break
+        db.session.remove()
+        time.sleep(every_hours * 3600)
+
+@bp.cli.command('compile-templates')
+@click.argument('target', type=click.Path(file_okay=False))
+def compile_templates_command(target):
+    """Precompile the Jinja templates for TIKOZETU_COMPILED_TEMPLATES."""
+    # Compile from the template folder even when precompiled templates are already in use
+    env = current_app.jinja_env.overlay(loader=current_app.jinja_loader)
+    env.compile_templates(target, zip=None, ignore_errors=False)
+    click.echo(f"Compiled {len(env.list_templates())} templates into {target}")
+
 # Routes
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/api/events')
+@bp.route('/api/events')
+@cached_response
 def get_events():
-    events = Event.query.all()
+    """List events in (date, id) order, one keyset page at a time.
+
+    Supports category, date_from/date_to, min_price/max_price and q (full-text)
+    filters. The cursor for the next page is returned in the X-Next-Cursor header.
+    Archived events are listed instead with archived=1.
+    """
+    try:
+        limit = parse_limit_arg(EVENTS_PAGE_SIZE, EVENTS_MAX_PAGE_SIZE)
+        
+        archived = request.args.get('archived') == '1'
+        if archived and not attach_archive():
+            return jsonify([])
+        if not archived:
+            sweep_expired_holds()
+        source = ArchivedEvent if archived else Event
+        query = db.session.query(source, User.name).join(User, User.id == source.organizer_id)
+        
+        category = request.args.get('category')
+        if category:
+            query = query.filter(source.category == category)
+        
+        date_from = parse_date_arg('date_from')
+        if date_from:
+            query = query.filter(source.date >= date_from)
+        date_to = parse_date_arg('date_to')
+        if date_to:
+            query = query.filter(source.date <= date_to)
+        
+        min_price = request.args.get('min_price', type=float)
+        if min_price is not None:
+            query = query.filter(source.price >= min_price)
+        max_price = request.args.get('max_price', type=float)
+        if max_price is not None:
+            query = query.filter(source.price <= max_price)
+        
+        search_term = request.args.get('q', '').strip()
+        if search_term:
+            query = apply_event_search(query, search_term, source)
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            cursor_date, cursor_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                source.date > cursor_date,
+                and_(source.date == cursor_date, source.id > cursor_id)
+            ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(source.date, source.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    events = [event for event, _ in rows]
+    
     events_data = []
-    for event in events:
+    for event, organizer_name in rows:
         events_data.append({
             'id': event.id,
             'title': event.title,
@@ -204,27 +2273,38 @@ def get_events():
             'location': event.location,
             'price': event.price,
             'capacity': event.capacity,
+            'tickets_remaining': event.tickets_remaining,
             'image_url': event.image_url,
-            'organizer': event.organizer.name
+            'organizer': organizer_name
         })
-    return jsonify(events_data)
+    
+    response = jsonify(events_data)
+    if has_more:
+        response.headers['X-Next-Cursor'] = encode_cursor(events[-1].date, events[-1].id)
+    return response
 
-@app.route('/api/register', methods=['POST'])
+@bp.route('/api/register', methods=['POST'])
 def register():
     try:
+        retry_after = register_ip_limiter.consume(request.remote_addr)
+        if retry_after:
+            return rate_limited(retry_after)
+        
         data = request.get_json()
         name = data.get('name')
         email = data.get('email')
         password = data.get('password')
         role = data.get('role', 'attendee')
         
-        if User.query.filter_by(email=email).first():
-            return jsonify({'error': 'Email already exists'}), 400
-        
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         new_user = User(name=name, email=email, password=hashed_password, role=role)
         db.session.add(new_user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # The unique index on email is the duplicate check
+            db.session.rollback()
+            return jsonify({'error': 'Email already exists'}), 400
         
         return jsonify({
             'message': 'User registered successfully',
@@ -235,18 +2315,29 @@ def register():
                 'role': new_user.role
             }
         }), 201
+    except AuthBusyError:
+        return auth_busy()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/login', methods=['POST'])
+@bp.route('/api/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
         email = data.get('email')
         password = data.get('password')
         
+        retry_after = (login_ip_limiter.consume(request.remote_addr)
+                       or login_email_limiter.consume((email or '').strip().lower()))
+        if retry_after:
+            return rate_limited(retry_after)
+        
         user = User.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password, password):
+        if user and run_password_work(check_password_hash, user.password, password):
+            if password_needs_rehash(user.password):
+                # Upgrade hashes made with older parameters while the password is at hand
+                user.password = hash_password(password)
+                db.session.commit()
             session['user_id'] = user.id
             session['user_name'] = user.name
             session['user_role'] = user.role
@@ -261,15 +2352,17 @@ def login():
             })
         
         return jsonify({'error': 'Invalid email or password'}), 401
+    except AuthBusyError:
+        return auth_busy()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/logout')
+@bp.route('/api/logout')
 def logout():
     session.clear()
     return jsonify({'message': 'Logged out successfully'})
 
-@app.route('/api/events/create', methods=['POST'])
+@bp.route('/api/events/create', methods=['POST'])
 def create_event():
     try:
         if 'user_id' not in session or session['user_role'] not in ['organizer', 'admin']:
@@ -309,7 +2402,11 @@ def create_event():
             payment_instructions=data.get('payment_instructions', 'Pay to the till number above and include your name as reference')
         )
         db.session.add(payment_info)
+        queue_notification(f'organizer:{new_event.organizer_id}', 'event_created', {
+            'event_id': new_event.id, 'title': new_event.title
+        })
         db.session.commit()
+        invalidate_event_cache(new_event.id)
         
         return jsonify({
             'message': 'Event created successfully', 
@@ -330,7 +2427,8 @@ def create_event():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/tickets/book', methods=['POST'])
+@bp.route('/api/tickets/book', methods=['POST'])
+@idempotent
 def book_ticket():
     try:
         if 'user_id' not in session:
@@ -340,39 +2438,58 @@ def book_ticket():
         event_id = data.get('event_id')
         quantity = data.get('quantity', 1)
         
-        event = Event.query.get(event_id)
-        if not event:
-            return jsonify({'error': 'Event not found'}), 404
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+            return jsonify({'error': 'Quantity must be a positive whole number'}), 400
         
-        # Generate booking reference
-        booking_ref = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+        # Take the seats first; if the event looks sold out, reclaim expired holds and retry once
+        reserved = reserve_seats(event_id, quantity)
+        if not reserved and release_expired_holds(event_id):
+            reserved = reserve_seats(event_id, quantity)
+        if not reserved:
+            db.session.rollback()
+            if not db.session.get(Event, event_id):
+                return jsonify({'error': 'Event not found'}), 404
+            return jsonify({'error': 'Not enough tickets remaining for this event'}), 409
         
-        total_price = event.price * quantity
+        total_price = reserved.price * quantity
         
         new_ticket = Ticket(
             event_id=event_id,
             attendee_id=session['user_id'],
             quantity=quantity,
             total_price=total_price,
-            booking_reference=booking_ref,
             qr_code_path=None,  # Will be generated after payment confirmation
-            payment_status='unpaid'
+            payment_status='unpaid',
+            hold_expires_at=datetime.utcnow() + timedelta(minutes=TICKET_HOLD_MINUTES)
         )
-        db.session.add(new_ticket)
-        db.session.commit()
+        # A clash with another process's reference only undoes the savepoint; issue a fresh one
+        for attempt in range(3):
+            new_ticket.booking_reference = generate_booking_reference()
+            try:
+                with db.session.begin_nested():
+                    db.session.add(new_ticket)
+            except IntegrityError:
+                if attempt == 2:
+                    raise
+            else:
+                break
+        booking_ref = new_ticket.booking_reference
+        bump_event_stats(event_id, total_tickets=1)
         
-        return jsonify({
+        return commit_response({
             'message': 'Ticket reserved successfully. Please complete payment.',
             'ticket_id': new_ticket.id,
             'booking_reference': booking_ref,
             'total_price': total_price,
-            'event_title': event.title,
-            'quantity': quantity
-        }), 201
+            'event_title': reserved.title,
+            'quantity': quantity,
+            'hold_expires_at': new_ticket.hold_expires_at.isoformat()
+        }, 201)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/events/<int:event_id>/payment-info')
+@bp.route('/api/events/<int:event_id>/payment-info')
+@cached_response
 def get_event_payment_info(event_id):
     payment_info = EventPayment.query.filter_by(event_id=event_id).first()
     if not payment_info:
@@ -384,7 +2501,8 @@ def get_event_payment_info(event_id):
         'payment_instructions': payment_info.payment_instructions
     })
 
-@app.route('/api/tickets/<int:ticket_id>/submit-payment', methods=['POST'])
+@bp.route('/api/tickets/<int:ticket_id>/submit-payment', methods=['POST'])
+@idempotent
 def submit_payment(ticket_id):
     try:
         if 'user_id' not in session:
@@ -396,22 +2514,55 @@ def submit_payment(ticket_id):
         if not ticket or ticket.attendee_id != session['user_id']:
             return jsonify({'error': 'Ticket not found'}), 404
         
+        # Only an unpaid ticket moves to pending, so a repeated submission cannot add a second payment
+        claimed = db.session.execute(db.update(Ticket).where(
+            Ticket.id == ticket_id,
+            Ticket.payment_status == 'unpaid'
+        ).values(payment_status='pending')).rowcount
+        if not claimed:
+            # The hold was released in the meantime; take the seats again if any are left
+            reclaimed = db.session.execute(db.update(Ticket).where(
+                Ticket.id == ticket_id,
+                Ticket.payment_status == 'expired'
+            ).values(payment_status='pending')).rowcount
+            if not reclaimed:
+                db.session.rollback()
+                return jsonify({'error': 'Payment has already been submitted for this ticket'}), 409
+            if not reserve_seats(ticket.event_id, ticket.quantity):
+                db.session.rollback()
+                return jsonify({'error': 'Your reservation expired and the event is sold out'}), 409
+            bump_event_stats(ticket.event_id, total_tickets=1)
+        
         # Create payment record
+        payment_reference = data.get('payment_reference', '')
         payment = Payment(
             ticket_id=ticket_id,
             amount=ticket.total_price,
             payment_method=data.get('payment_method', 'MPESA'),
-            payment_reference=data.get('payment_reference', ''),
+            payment_reference=payment_reference,
+            reference_key=normalize_payment_reference(payment_reference),
             status='pending'
         )
         
-        # Update ticket payment status
-        ticket.payment_status = 'pending'
-        
         db.session.add(payment)
-        db.session.commit()
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # ux_payment_active_reference: the code already backs another active payment
+            db.session.rollback()
+            return jsonify({'error': 'This payment reference has already been submitted'}), 409
+        bump_event_stats(ticket.event_id, pending_payments=1)
+        queue_notification(f'event:{ticket.event_id}', 'payment_pending', {
+            'event_id': ticket.event_id,
+            'payment_id': payment.id,
+            'ticket_id': ticket_id,
+            'booking_reference': ticket.booking_reference,
+            'amount': payment.amount,
+            'payment_method': payment.payment_method,
+            'payment_reference': payment_reference
+        })
         
-        return jsonify({
+        return commit_response({
             'message': 'Payment submitted successfully. Waiting for organizer confirmation.',
             'payment_id': payment.id
         })
@@ -419,36 +2570,76 @@ def submit_payment(ticket_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/organizer/payments/pending')
+@bp.route('/api/organizer/payments/pending')
 def get_pending_payments():
+    """List the organizer's pending payments oldest first, paginated by cursor.
+
+    Pass since=<created_at> to fetch only payments submitted after that time.
+    """
     if 'user_id' not in session or session['user_role'] not in ['organizer', 'admin']:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    # Get events organized by this user
-    user_events = Event.query.filter_by(organizer_id=session['user_id']).all()
-    event_ids = [event.id for event in user_events]
+    try:
+        limit = parse_limit_arg(PAYMENTS_PAGE_SIZE, PAYMENTS_MAX_PAGE_SIZE)
+        
+        # One joined query for just the columns the queue shows
+        query = db.session.query(
+            Payment.id,
+            Payment.ticket_id,
+            Event.title,
+            User.name,
+            Payment.amount,
+            Payment.payment_reference,
+            Payment.payment_method,
+            Payment.created_at
+        ).join(Ticket, Ticket.id == Payment.ticket_id).join(
+            Event, Event.id == Ticket.event_id
+        ).join(
+            User, User.id == Ticket.attendee_id
+        ).filter(
+            Event.organizer_id == session['user_id'],
+            Payment.status == 'pending'
+        )
+        
+        # Pollers pass the created_at of the newest payment they have seen
+        since = parse_date_arg('since')
+        if since:
+            query = query.filter(Payment.created_at > since)
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            cursor_date, cursor_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                Payment.created_at > cursor_date,
+                and_(Payment.created_at == cursor_date, Payment.id > cursor_id)
+            ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    pending_payments = Payment.query.join(Ticket).filter(
-        Ticket.event_id.in_(event_ids),
-        Payment.status == 'pending'
-    ).all()
+    rows = query.order_by(Payment.created_at, Payment.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
     payments_data = []
-    for payment in pending_payments:
+    for payment_id, ticket_id, event_title, attendee_name, amount, reference, method, created_at in rows:
         payments_data.append({
-            'payment_id': payment.id,
-            'ticket_id': payment.ticket_id,
-            'event_title': payment.ticket.event.title,
-            'attendee_name': payment.ticket.attendee.name,
-            'amount': payment.amount,
-            'payment_reference': payment.payment_reference,
-            'payment_method': payment.payment_method,
-            'created_at': payment.created_at.isoformat()
+            'payment_id': payment_id,
+            'ticket_id': ticket_id,
+            'event_title': event_title,
+            'attendee_name': attendee_name,
+            'amount': amount,
+            'payment_reference': reference,
+            'payment_method': method,
+            'created_at': created_at.isoformat()
         })
     
-    return jsonify(payments_data)
+    response = jsonify(payments_data)
+    if has_more:
+        last = rows[-1]
+        response.headers['X-Next-Cursor'] = encode_cursor(last.created_at, last.id)
+    return response
 
-@app.route('/api/organizer/payments/<int:payment_id>/confirm', methods=['POST'])
+@bp.route('/api/organizer/payments/<int:payment_id>/confirm', methods=['POST'])
 def confirm_payment(payment_id):
     try:
         if 'user_id' not in session or session['user_role'] not in ['organizer', 'admin']:
@@ -463,31 +2654,38 @@ def confirm_payment(payment_id):
         if event_organizer_id != session['user_id'] and session['user_role'] != 'admin':
             return jsonify({'error': 'Unauthorized'}), 401
         
-        payment.status = 'confirmed'
-        payment.confirmed_at = datetime.utcnow()
-        payment.ticket.payment_status = 'paid'
+        # A rejected payment's seats may have been released and resold since
+        if payment.status != 'pending':
+            return jsonify({'error': f'Payment is already {payment.status}'}), 409
         
-        # Generate QR code for the ticket
-        booking_ref = payment.ticket.booking_reference
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr_data = f"TikoZetu|{booking_ref}|{payment.ticket.event_id}|{payment.ticket.attendee_id}|{payment.ticket.quantity}"
-        qr.add_data(qr_data)
-        qr.make(fit=True)
+        if transition_payment(payment, 'confirmed') is None:
+            db.session.rollback()
+            return jsonify({'error': 'Payment was updated by another request. Please refresh.'}), 409
         
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_path = f"static/qrcodes/{booking_ref}.png"
-        os.makedirs(os.path.dirname(qr_path), exist_ok=True)
-        qr_img.save(qr_path)
+        ticket = payment.ticket
+        deltas = {'pending_payments': -1}
+        if ticket.payment_status != 'paid':
+            deltas.update(confirmed_tickets=1, revenue=ticket.total_price)
+        bump_event_stats(ticket.event_id, **deltas)
         
-        payment.ticket.qr_code_path = qr_path
+        payment.confirmed_at = datetime.utcnow()
+        payment.ticket.payment_status = 'paid'
+        
+        # Served on demand; a worker pre-renders it once the confirmation is committed
+        payment.ticket.qr_code_path = ticket_qr_url(payment.ticket.booking_reference)
+        payment.ticket.qr_status = 'queued'
+        notify_ticket_status(ticket.attendee_id, ticket.id, 'paid')
+        notify_payment_resolved(ticket.event_id, payment.id, 'confirmed')
         
         db.session.commit()
+        queue_qr_render(payment.ticket)
         
         return jsonify({
             'message': 'Payment confirmed successfully',
             'ticket': {
-                'booking_reference': booking_ref,
-                'qr_code_path': f'/{qr_path}',
+                'booking_reference': payment.ticket.booking_reference,
+                'qr_code_path': payment.ticket.qr_code_path,
+                'qr_status': 'queued',
                 'payment_status': 'paid'
             }
         })
@@ -495,7 +2693,7 @@ def confirm_payment(payment_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/organizer/payments/<int:payment_id>/reject', methods=['POST'])
+@bp.route('/api/organizer/payments/<int:payment_id>/reject', methods=['POST'])
 def reject_payment(payment_id):
     try:
         if 'user_id' not in session or session['user_role'] not in ['organizer', 'admin']:
@@ -510,8 +2708,27 @@ def reject_payment(payment_id):
         if event_organizer_id != session['user_id'] and session['user_role'] != 'admin':
             return jsonify({'error': 'Unauthorized'}), 401
         
-        payment.status = 'rejected'
+        # The ticket of a rejected payment has moved on, possibly to a new payment
+        if payment.status == 'rejected':
+            return jsonify({'error': 'Payment is already rejected'}), 409
+        
+        previous_status = transition_payment(payment, 'rejected')
+        if previous_status is None:
+            db.session.rollback()
+            return jsonify({'error': 'Payment was updated by another request. Please refresh.'}), 409
+        
+        ticket = payment.ticket
+        deltas = {'pending_payments': -1} if previous_status == 'pending' else {}
+        if ticket.payment_status == 'paid':
+            deltas.update(confirmed_tickets=-1, revenue=-ticket.total_price)
+        if deltas:
+            bump_event_stats(ticket.event_id, **deltas)
+        
         payment.ticket.payment_status = 'unpaid'
+        # Give the attendee a fresh hold to resubmit before the seats are released
+        payment.ticket.hold_expires_at = datetime.utcnow() + timedelta(minutes=TICKET_HOLD_MINUTES)
+        notify_ticket_status(ticket.attendee_id, ticket.id, 'unpaid')
+        notify_payment_resolved(ticket.event_id, payment.id, 'rejected')
         
         db.session.commit()
         
@@ -522,31 +2739,429 @@ def reject_payment(payment_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/user/tickets')
+@bp.route('/api/organizer/payments/bulk', methods=['POST'])
+def bulk_update_payments():
+    """Confirm or reject many pending payments in one transaction.
+
+    Expects {"payment_ids": [...], "action": "confirm" | "reject"} and returns
+    a result for every requested id.
+    """
+    try:
+        if 'user_id' not in session or session['user_role'] not in ['organizer', 'admin']:
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        data = request.get_json() or {}
+        action = data.get('action')
+        payment_ids = data.get('payment_ids')
+        
+        if action not in ['confirm', 'reject']:
+            return jsonify({'error': 'Action must be confirm or reject'}), 400
+        if (not isinstance(payment_ids, list) or not payment_ids
+                or not all(isinstance(pid, int) and not isinstance(pid, bool) for pid in payment_ids)):
+            return jsonify({'error': 'payment_ids must be a non-empty list of payment ids'}), 400
+        if len(payment_ids) > BULK_PAYMENTS_MAX:
+            return jsonify({'error': f'At most {BULK_PAYMENTS_MAX} payments can be updated at once'}), 400
+        payment_ids = list(dict.fromkeys(payment_ids))
+        
+        # One query checks existence, ownership and current state for every id
+        rows = db.session.query(
+            Payment.id,
+            Payment.status,
+            Ticket.id.label('ticket_id'),
+            Ticket.event_id,
+            Ticket.attendee_id,
+            Ticket.payment_status,
+            Ticket.total_price,
+            Event.organizer_id
+        ).join(Ticket, Ticket.id == Payment.ticket_id).join(
+            Event, Event.id == Ticket.event_id
+        ).filter(Payment.id.in_(payment_ids)).all()
+        rows_by_id = {row.id: row for row in rows}
+        
+        results = {}
+        eligible = {}
+        for payment_id in payment_ids:
+            row = rows_by_id.get(payment_id)
+            if not row:
+                results[payment_id] = {'payment_id': payment_id, 'status': 'not_found'}
+            elif row.organizer_id != session['user_id'] and session['user_role'] != 'admin':
+                results[payment_id] = {'payment_id': payment_id, 'status': 'unauthorized'}
+            elif row.status != 'pending':
+                results[payment_id] = {'payment_id': payment_id, 'status': 'skipped',
+                                       'reason': f'Payment is already {row.status}'}
+            else:
+                eligible[payment_id] = row
+        
+        new_status = 'confirmed' if action == 'confirm' else 'rejected'
+        updated = apply_payment_action(list(eligible.values()), action)
+        ticket_ids = [row.ticket_id for row in updated]
+        
+        db.session.commit()
+        
+        if action == 'confirm':
+            queue_qr_renders(ticket_ids)
+        
+        for row in updated:
+            results[row.id] = {'payment_id': row.id, 'status': new_status}
+        for payment_id in eligible:
+            if payment_id not in results:
+                results[payment_id] = {'payment_id': payment_id, 'status': 'skipped',
+                                       'reason': 'Payment was updated by another request'}
+        
+        return jsonify({
+            'action': action,
+            'updated': len(updated),
+            'results': [results[payment_id] for payment_id in payment_ids]
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/organizer/payments/reconcile', methods=['POST'])
+def reconcile_payments():
+    """Auto-confirm pending payments from an uploaded M-PESA statement CSV.
+
+    The file (form field "statement") is streamed in batches, so memory stays
+    flat however long it is. A line confirms a payment when its receipt code
+    matches exactly one pending payment_reference for the same amount;
+    wrong amounts and references shared by several tickets are reported instead.
+    """
+    try:
+        if 'user_id' not in session or session['user_role'] not in ['organizer', 'admin']:
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        upload = request.files.get('statement')
+        if not upload:
+            return jsonify({'error': 'Upload the statement CSV in the "statement" field'}), 400
+        
+        reader = csv.DictReader(io.TextIOWrapper(upload.stream, encoding='utf-8-sig', errors='replace', newline=''))
+        code_column = find_statement_column(reader.fieldnames, STATEMENT_CODE_COLUMNS)
+        amount_column = find_statement_column(reader.fieldnames, STATEMENT_AMOUNT_COLUMNS)
+        status_column = find_statement_column(reader.fieldnames, STATEMENT_STATUS_COLUMNS)
+        if not code_column or not amount_column:
+            return jsonify({'error': 'Statement needs a receipt number column and a paid in/amount column'}), 400
+        
+        organizer_id = None if session['user_role'] == 'admin' else session['user_id']
+        report = {
+            'lines': 0,
+            'skipped': 0,
+            'unmatched': 0,
+            'confirmed': 0,
+            'confirmed_payment_ids': [],
+            'mismatches': []
+        }
+        matched_codes = set()
+        batch = []
+        
+        # Line 1 is the header row
+        for line_number, line in enumerate(reader, start=2):
+            report['lines'] += 1
+            code_key = normalize_payment_reference(line.get(code_column))
+            amount = parse_statement_amount(line.get(amount_column))
+            status = (line.get(status_column) or 'completed').strip().lower() if status_column else 'completed'
+            if not code_key or amount is None or amount <= 0 or status != 'completed':
+                report['skipped'] += 1
+                continue
+            
+            batch.append((line_number, code_key, amount))
+            if len(batch) >= RECONCILE_BATCH_SIZE:
+                reconcile_statement_batch(batch, organizer_id, report, matched_codes)
+                batch = []
+        
+        if batch:
+            reconcile_statement_batch(batch, organizer_id, report, matched_codes)
+        
+        return jsonify(report)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/checkin', methods=['POST'])
+def check_in_ticket():
+    """Admit a ticket at the gate from its scanned QR payload.
+
+    Expects {"code": "TikoZetu|..."} or {"booking_reference": "..."}. The
+    check and the flip of is_checked_in are one conditional UPDATE, so a
+    second scan of the same ticket is always rejected.
+    """
+    try:
+        if 'user_id' not in session or session['user_role'] not in ['organizer', 'admin']:
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        data = request.get_json() or {}
+        conditions = []
+        if data.get('code'):
+            try:
+                booking_ref, event_id, attendee_id, quantity = parse_ticket_qr_payload(data['code'])
+            except ValueError as e:
+                return jsonify({'error': str(e), 'status': 'invalid'}), 400
+            # Every field of the code must match the ticket, so altered codes are rejected
+            conditions += [Ticket.event_id == event_id, Ticket.attendee_id == attendee_id,
+                           Ticket.quantity == quantity]
+        elif data.get('booking_reference'):
+            booking_ref = normalize_booking_reference(data['booking_reference'])
+        else:
+            return jsonify({'error': 'Provide the scanned code or a booking reference', 'status': 'invalid'}), 400
+        
+        if not booking_reference_looks_valid(booking_ref):
+            return jsonify({'error': 'Booking reference is mistyped', 'status': 'invalid'}), 400
+        
+        if session['user_role'] != 'admin':
+            conditions.append(Ticket.event_id.in_(
+                db.select(Event.id).where(Event.organizer_id == session['user_id'])
+            ))
+        
+        admitted = db.session.execute(db.update(Ticket).where(
+            Ticket.booking_reference == booking_ref,
+            Ticket.payment_status == 'paid',
+            Ticket.is_checked_in.isnot(True),
+            *conditions
+        ).values(
+            is_checked_in=True,
+            checked_in_at=datetime.utcnow()
+        ).returning(Ticket.event_id, Ticket.quantity)).first()
+        
+        if admitted:
+            db.session.commit()
+            return jsonify({
+                'status': 'admitted',
+                'booking_reference': booking_ref,
+                'event_id': admitted.event_id,
+                'quantity': admitted.quantity
+            })
+        
+        # Work out why the scan was refused
+        db.session.rollback()
+        ticket = db.session.query(
+            Ticket.payment_status, Ticket.is_checked_in, Ticket.checked_in_at
+        ).filter(Ticket.booking_reference == booking_ref, *conditions).first()
+        if not ticket:
+            return jsonify({'error': 'Ticket not found', 'status': 'invalid'}), 404
+        if ticket.is_checked_in:
+            return jsonify({
+                'error': 'Ticket already checked in',
+                'status': 'duplicate',
+                'checked_in_at': ticket.checked_in_at.isoformat() if ticket.checked_in_at else None
+            }), 409
+        return jsonify({'error': 'Ticket has not been paid for', 'status': 'unpaid'}), 402
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/organizer/events/<int:event_id>/manifest')
+def get_event_manifest(event_id):
+    """Sorted booking references of an event's paid tickets, for offline validation on scanners.
+
+    format=text returns one reference per line; the default is JSON. The
+    ETag changes whenever the set of admissible tickets does.
+    """
+    if 'user_id' not in session or session['user_role'] not in ['organizer', 'admin']:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    event = db.session.get(Event, event_id)
+    if not event or (event.organizer_id != session['user_id'] and session['user_role'] != 'admin'):
+        return jsonify({'error': 'Event not found'}), 404
+    
+    references = db.session.execute(db.select(Ticket.booking_reference).where(
+        Ticket.event_id == event_id,
+        Ticket.payment_status == 'paid'
+    ).order_by(Ticket.booking_reference)).scalars().all()
+    
+    manifest_format = 'text' if request.args.get('format') == 'text' else 'json'
+    body = '\n'.join(references)
+    etag = hashlib.sha1(f'{manifest_format}|{body}'.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    elif manifest_format == 'text':
+        response = current_app.response_class(body + '\n' if body else '', mimetype='text/plain')
+    else:
+        response = jsonify({
+            'event_id': event_id,
+            'generated_at': datetime.utcnow().isoformat(),
+            'count': len(references),
+            'references': references
+        })
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/api/organizer/events/<int:event_id>/export')
+def export_event(event_id):
+    """Stream an event's attendee list (type=attendees) or payment ledger (type=payments).
+
+    format=csv (the default) or format=ndjson. Rows are read in batches of
+    EXPORT_BATCH_SIZE and written out as they arrive, so memory use does not
+    grow with the size of the event. An archived event is exported from the
+    archive with archived=1.
+    """
+    if 'user_id' not in session or session['user_role'] not in ['organizer', 'admin']:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    export_type = request.args.get('type', 'attendees')
+    export_format = request.args.get('format', 'csv')
+    if export_type not in ['attendees', 'payments']:
+        return jsonify({'error': 'type must be attendees or payments'}), 400
+    if export_format not in ['csv', 'ndjson']:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    archived = request.args.get('archived') == '1'
+    # An archived event's summary stays in the live database, so ownership is checked there
+    event = db.session.get(ArchivedEventSummary if archived else Event, event_id)
+    if not event or (event.organizer_id != session['user_id'] and session['user_role'] != 'admin'):
+        return jsonify({'error': 'Event not found'}), 404
+    if archived and not attach_archive():
+        return jsonify({'error': 'Event not found'}), 404
+    
+    statement = build_export_query(export_type, event_id, archived).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    rows = export_csv_rows if export_format == 'csv' else export_ndjson_rows
+    filename = f'event-{event_id}-{export_type}.{export_format}'
+    return current_app.response_class(
+        stream_with_context(rows(db.session.execute(statement))),
+        mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'Cache-Control': 'no-store'}
+    )
+
+@bp.route('/api/user/tickets')
 def get_user_tickets():
+    """The logged-in user's tickets newest first, paginated by cursor.
+
+    status=paid,pending filters by payment status, and archived=1 lists
+    tickets for archived events instead. The ETag changes whenever any of
+    the user's tickets does, so a client revalidating with If-None-Match
+    gets a 304 after a single aggregate query.
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Please login to view tickets'}), 401
     
-    tickets = Ticket.query.filter_by(attendee_id=session['user_id']).all()
-    tickets_data = []
+    archived = request.args.get('archived') == '1'
+    if archived and not attach_archive():
+        return jsonify([])
+    ticket_source, event_source = (ArchivedTicket, ArchivedEvent) if archived else (Ticket, Event)
     
-    for ticket in tickets:
+    try:
+        limit = parse_limit_arg(TICKETS_PAGE_SIZE, TICKETS_MAX_PAGE_SIZE)
+        statuses = [status for status in request.args.get('status', '').split(',') if status]
+        if any(status not in TICKET_STATUSES for status in statuses):
+            raise ValueError(f"status must be one or more of {', '.join(TICKET_STATUSES)}")
+        cursor = request.args.get('cursor')
+        cursor_position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    user_id = session['user_id']
+    ticket_count, last_change = db.session.execute(db.select(
+        db.func.count(ticket_source.id), db.func.max(ticket_source.updated_at)
+    ).where(ticket_source.attendee_id == user_id)).one()
+    etag = hashlib.sha1(f'{user_id}|{ticket_count}|{last_change}|{request.query_string.decode()}'.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    
+    # One joined query for the ticket and the event fields the wallet shows
+    query = db.session.query(
+        ticket_source.id,
+        ticket_source.quantity,
+        ticket_source.total_price,
+        ticket_source.booking_reference,
+        ticket_source.payment_status,
+        ticket_source.qr_code_path,
+        ticket_source.qr_status,
+        ticket_source.created_at,
+        event_source.title,
+        event_source.date,
+        event_source.location
+    ).join(event_source, event_source.id == ticket_source.event_id).filter(ticket_source.attendee_id == user_id)
+    if statuses:
+        query = query.filter(ticket_source.payment_status.in_(statuses))
+    if cursor_position:
+        cursor_date, cursor_id = cursor_position
+        query = query.filter(or_(
+            ticket_source.created_at < cursor_date,
+            and_(ticket_source.created_at == cursor_date, ticket_source.id < cursor_id)
+        ))
+    
+    rows = query.order_by(ticket_source.created_at.desc(), ticket_source.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    tickets_data = []
+    for row in rows:
         tickets_data.append({
-            'id': ticket.id,
-            'event_title': ticket.event.title,
-            'event_date': ticket.event.date.isoformat(),
-            'event_location': ticket.event.location,
-            'quantity': ticket.quantity,
-            'total_price': ticket.total_price,
-            'booking_reference': ticket.booking_reference,
-            'payment_status': ticket.payment_status,
-            'qr_code_path': ticket.qr_code_path,
-            'created_at': ticket.created_at.isoformat()
+            'id': row.id,
+            'event_title': row.title,
+            'event_date': row.date.isoformat(),
+            'event_location': row.location,
+            'quantity': row.quantity,
+            'total_price': row.total_price,
+            'booking_reference': row.booking_reference,
+            'payment_status': row.payment_status,
+            'qr_code_path': row.qr_code_path,
+            'qr_status': row.qr_status,
+            'created_at': row.created_at.isoformat()
         })
     
-    return jsonify(tickets_data)
+    response = jsonify(tickets_data)
+    if has_more:
+        last = rows[-1]
+        response.headers['X-Next-Cursor'] = encode_cursor(last.created_at, last.id)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/api/tickets/<int:ticket_id>/qr-status')
+def get_ticket_qr_status(ticket_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Please login to view tickets'}), 401
+    
+    ticket = db.session.get(Ticket, ticket_id)
+    if not ticket or ticket.attendee_id != session['user_id']:
+        return jsonify({'error': 'Ticket not found'}), 404
+    
+    return jsonify({
+        'qr_status': ticket.qr_status,
+        'qr_code_path': ticket.qr_code_path
+    })
+
+@bp.route('/api/tickets/<booking_ref>/qr')
+def get_ticket_qr(booking_ref):
+    """Render a paid ticket's QR code as PNG (default) or SVG via ?format="""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Please login to view tickets'}), 401
+    
+    image_format = request.args.get('format', 'png')
+    if image_format not in QR_MIMETYPES:
+        return jsonify({'error': 'Unsupported format. Use png or svg.'}), 400
+    
+    ticket = Ticket.query.options(joinedload(Ticket.event)).filter_by(booking_reference=booking_ref).first()
+    if not ticket or ticket.payment_status != 'paid':
+        return jsonify({'error': 'Ticket not found'}), 404
+    
+    # Attendees see their own tickets; organizers see tickets for their events
+    if (ticket.attendee_id != session['user_id'] and ticket.event.organizer_id != session['user_id']
+            and session.get('user_role') != 'admin'):
+        return jsonify({'error': 'Ticket not found'}), 404
+    
+    qr_data = ticket_qr_payload(ticket)
+    etag = hashlib.sha1(f'{image_format}|{QR_BOX_SIZE}|{QR_BORDER}|{QR_MASK_PATTERN}|{qr_data}'.encode()).hexdigest()
+    
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(get_qr_image(qr_data, image_format), mimetype=QR_MIMETYPES[image_format])
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = QR_CACHE_MAX_AGE
+    return response
 
-@app.route('/api/user/profile')
+@bp.route('/api/user/profile')
 def get_user_profile():
     if 'user_id' not in session:
         return jsonify({'error': 'Not logged in'}), 401
@@ -562,37 +3177,163 @@ def get_user_profile():
         'role': user.role
     })
 
-@app.route('/api/organizer/dashboard')
+@bp.route('/api/stream')
+def stream_updates():
+    """Server-Sent Events feed of changes relevant to the logged-in user.
+
+    Attendees receive ticket_status and ticket_qr for their own tickets.
+    Organizers and admins also receive payment_pending, payment_resolved
+    and event_stats for the events they organize, including ones created
+    while the stream is open. A resync event means notifications were
+    dropped and the client should refetch.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Please login to receive updates'}), 401
+    
+    user_id = session['user_id']
+    role = session['user_role']
+    channels = [f'user:{user_id}']
+    if role in ['organizer', 'admin']:
+        channels.append(f'organizer:{user_id}')
+        event_ids = db.session.execute(db.select(Event.id).where(Event.organizer_id == user_id)).scalars().all()
+        channels.extend(f'event:{event_id}' for event_id in event_ids)
+    # Streams stay open for a long time; do not keep a pooled connection checked out
+    db.session.close()
+    
+    subscriber = notification_broker.subscribe(channels)
+    if subscriber is None:
+        return jsonify({'error': 'Too many open update streams. Please try again later.'}), 503
+    
+    def generate():
+        try:
+            yield f'retry: {STREAM_HEARTBEAT_SECONDS * 1000}\n\n'
+            yield format_stream_message('ready', {'role': role})
+            while True:
+                try:
+                    name, data = subscriber.queue.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Comment lines keep proxies from timing out and surface dead clients
+                    yield ': keep-alive\n\n'
+                    continue
+                if subscriber.overflowed:
+                    subscriber.overflowed = False
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    yield format_stream_message('resync', {})
+                    continue
+                if name == 'event_created':
+                    notification_broker.add_channel(subscriber, f"event:{data['event_id']}")
+                yield format_stream_message(name, data)
+        finally:
+            notification_broker.unsubscribe(subscriber)
+    
+    return current_app.response_class(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@bp.route('/metrics')
+def get_metrics():
+    """Prometheus scrape endpoint; only served when instrumentation is enabled"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    lines = route_metrics.render()
+    cache_stats = {'responses': response_cache.stats(), 'qr_codes': qr_cache.stats()}
+    for key, kind in [('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'),
+                      ('entries', 'gauge'), ('bytes', 'gauge')]:
+        name = f'tikozetu_cache_{key}_total' if kind == 'counter' else f'tikozetu_cache_{key}'
+        lines.append(f'# TYPE {name} {kind}')
+        lines += [f'{name}{{cache="{cache_name}"}} {stats[key]}' for cache_name, stats in cache_stats.items()]
+    lines.append('# TYPE tikozetu_stream_subscribers gauge')
+    lines.append(f'tikozetu_stream_subscribers {notification_broker.stats()["subscribers"]}')
+    return current_app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/admin/cache-stats')
+def get_cache_stats():
+    if 'user_id' not in session or session['user_role'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify({
+        'responses': response_cache.stats(),
+        'qr_codes': qr_cache.stats(),
+        'streams': notification_broker.stats()
+    })
+
+@bp.route('/api/organizer/dashboard')
 def get_organizer_dashboard():
     if 'user_id' not in session or session['user_role'] not in ['organizer', 'admin']:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    # Get organizer's events
-    events = Event.query.filter_by(organizer_id=session['user_id']).all()
+    sweep_expired_holds()
+    # Counters come precomputed from event_stats, so this is one query for all events
+    rows = db.session.query(Event.id, Event.title, Event.date, EventStats).outerjoin(
+        EventStats, EventStats.event_id == Event.id
+    ).filter(Event.organizer_id == session['user_id']).all()
     events_data = []
     
-    for event in events:
-        total_tickets = Ticket.query.filter_by(event_id=event.id).count()
-        confirmed_tickets = Ticket.query.filter_by(event_id=event.id, payment_status='paid').count()
-        pending_payments = Payment.query.join(Ticket).filter(
-            Ticket.event_id == event.id,
-            Payment.status == 'pending'
-        ).count()
-        
+    for event_id, title, date, stats in rows:
         events_data.append({
-            'id': event.id,
-            'title': event.title,
-            'date': event.date.isoformat(),
-            'total_tickets': total_tickets,
-            'confirmed_tickets': confirmed_tickets,
-            'pending_payments': pending_payments,
-            'revenue': confirmed_tickets * event.price
+            'id': event_id,
+            'title': title,
+            'date': date.isoformat(),
+            'total_tickets': stats.total_tickets if stats else 0,
+            'confirmed_tickets': stats.confirmed_tickets if stats else 0,
+            'pending_payments': stats.pending_payments if stats else 0,
+            'revenue': stats.revenue if stats else 0,
+            'archived': False
+        })
+    
+    # Archived events come from their summaries, without opening the archive
+    summaries = ArchivedEventSummary.query.filter_by(organizer_id=session['user_id']).order_by(
+        ArchivedEventSummary.date.desc()
+    )
+    for summary in summaries:
+        events_data.append({
+            'id': summary.event_id,
+            'title': summary.title,
+            'date': summary.date.isoformat(),
+            'total_tickets': summary.total_tickets,
+            'confirmed_tickets': summary.confirmed_tickets,
+            'pending_payments': summary.pending_payments,
+            'revenue': summary.revenue,
+            'archived': True
         })
     
     return jsonify(events_data)
 
+def create_app(config=None):
+    """Build the application. Nothing here touches the database: the engine
+    connects, and pending migrations run, when the first request arrives."""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = SECRET_KEY
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URI
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config:
+        app.config.update(config)
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite:'):
+        raise ValueError('TikoZetu requires a SQLite database; set TIKOZETU_DATABASE_URI to a sqlite:/// URI')
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', database_engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    if COMPILED_TEMPLATES_DIR:
+        app.jinja_options = {**app.jinja_options, 'loader': ModuleLoader(COMPILED_TEMPLATES_DIR)}
+    
+    if PROXY_HOPS:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS, x_proto=PROXY_HOPS)
+    CORS(app, expose_headers=['X-Next-Cursor'])
+    db.init_app(app)
+    app.register_blueprint(bp)
+    if METRICS_ENABLED:
+        install_request_metrics(app)
+    return app
+
+# The WSGI entry point for gunicorn (app:app), Vercel and `flask run`
+app = create_app()
+
 if __name__ == '__main__':
     with app.app_context():
         # Check and update database schema
         check_and_update_schema()
+        requeue_pending_qr_codes()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
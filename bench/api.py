@@ -0,0 +1,290 @@
+"""Load-test the main API endpoints and report latency percentiles as JSON.
+
+Usage: python bench/api.py [--users 2000] [--events 200] [--tickets 20000]
+                           [--requests 500] [--concurrency 4]
+                           [--target client gunicorn] [--output results.json]
+
+Seeds a synthetic dataset into a throwaway SQLite database with the
+`flask seed` loader (not the three sample fixtures), then drives every
+scenario through the Flask test client and/or a local gunicorn, each
+against a fresh copy of the same data.
+Reports p50/p95/p99 latency and throughput per endpoint, and writes them
+with the commit, dataset and settings as JSON so runs can be compared
+across commits.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+import fixtures
+from fixtures import ROOT
+
+SCENARIOS = ['get_events', 'book_ticket', 'submit_payment', 'confirm_payment',
+             'get_pending_payments', 'get_organizer_dashboard', 'get_user_tickets']
+
+
+def seed_dataset(args, rng):
+    """Load the synthetic dataset with the `flask seed` loader; returns the ids scenarios need"""
+    from app import app, db, check_and_update_schema, seed_synthetic_data, User, Event, Ticket, Payment
+    from sqlalchemy import text
+
+    with app.app_context():
+        check_and_update_schema(sample_data=False)
+        seed_synthetic_data(args.users, args.events, args.tickets, random_seed=args.seed)
+        # Leave plenty of room for the booking scenario
+        db.session.execute(db.update(Event).values(
+            capacity=Event.capacity + args.requests * 10,
+            tickets_remaining=Event.tickets_remaining + args.requests * 10
+        ))
+        db.session.commit()
+
+        organizer_ids = db.session.execute(db.select(User.id).where(User.role == 'organizer')).scalars().all()
+        attendee_ids = db.session.execute(db.select(User.id).where(User.role == 'attendee')).scalars().all()
+        event_ids = db.session.execute(db.select(Event.id)).scalars().all()
+        unpaid = [tuple(row) for row in db.session.execute(
+            db.select(Ticket.id, Ticket.attendee_id).where(Ticket.payment_status == 'unpaid')
+        )]
+        pending = [tuple(row) for row in db.session.execute(
+            db.select(Payment.id, Event.organizer_id).join(Ticket, Ticket.id == Payment.ticket_id)
+            .join(Event, Event.id == Ticket.event_id).where(Payment.status == 'pending')
+        )]
+        db.session.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+        db.session.commit()
+        db.engine.dispose()
+
+    rng.shuffle(unpaid)
+    rng.shuffle(pending)
+    return {
+        'organizer_ids': organizer_ids,
+        'attendee_ids': attendee_ids,
+        'event_ids': event_ids,
+        'unpaid': unpaid,
+        'pending': pending
+    }
+
+
+def build_plan(data, cookies, args, rng):
+    """One list of (method, path, body, cookie) per scenario, consuming unique rows where needed"""
+    from app import SEED_CATEGORIES
+
+    attendee, organizer = cookies['attendee'], cookies['organizer']
+    plan = {}
+    plan['get_events'] = [
+        ('GET', rng.choice(['/api/events', f'/api/events?{urlencode({"category": rng.choice(SEED_CATEGORIES)})}',
+                            '/api/events?limit=20']), None, None)
+        for _ in range(args.requests)
+    ]
+    plan['book_ticket'] = [
+        ('POST', '/api/tickets/book', {'event_id': rng.choice(data['event_ids']), 'quantity': 1},
+         attendee[rng.choice(data['attendee_ids'])])
+        for _ in range(args.requests)
+    ]
+    plan['submit_payment'] = [
+        ('POST', f'/api/tickets/{ticket_id}/submit-payment',
+         {'payment_method': 'MPESA', 'payment_reference': f'QS{ticket_id:08d}'}, attendee[attendee_id])
+        for ticket_id, attendee_id in data['unpaid'][:args.requests]
+    ]
+    plan['confirm_payment'] = [
+        ('POST', f'/api/organizer/payments/{payment_id}/confirm', None, organizer[organizer_id])
+        for payment_id, organizer_id in data['pending'][:args.requests]
+    ]
+    plan['get_pending_payments'] = [
+        ('GET', '/api/organizer/payments/pending', None, organizer[rng.choice(data['organizer_ids'])])
+        for _ in range(args.requests)
+    ]
+    plan['get_organizer_dashboard'] = [
+        ('GET', '/api/organizer/dashboard', None, organizer[rng.choice(data['organizer_ids'])])
+        for _ in range(args.requests)
+    ]
+    plan['get_user_tickets'] = [
+        ('GET', '/api/user/tickets', None, attendee[rng.choice(data['attendee_ids'])])
+        for _ in range(args.requests)
+    ]
+    return plan
+
+
+def client_sender(app):
+    client = app.test_client(use_cookies=False)
+
+    def send(method, path, body, cookie):
+        headers = {'Cookie': f'session={cookie}'} if cookie else {}
+        response = client.open(path, method=method, json=body, headers=headers)
+        response.close()
+        return response.status_code
+    return send
+
+
+def http_sender(port):
+    def send(method, path, body, cookie):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        headers = {'Content-Type': 'application/json'}
+        if cookie:
+            headers['Cookie'] = f'session={cookie}'
+        connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        return response.status
+    return send
+
+
+def run_scenario(send, requests, concurrency):
+    def timed(item):
+        started = time.perf_counter()
+        try:
+            status = send(*item)
+        except Exception:
+            status = 'error'
+        return status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, requests))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(duration * 1000 for _, duration in outcomes)
+    statuses = Counter(str(status) for status, _ in outcomes)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(outcomes),
+        'errors': sum(count for status, count in statuses.items() if not status.startswith(('2', '3'))),
+        'statuses': dict(statuses),
+        'throughput_rps': round(len(outcomes) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.fmean(latencies), 2) if latencies else None,
+        'p50_ms': round(cuts[49], 2) if latencies else None,
+        'p95_ms': round(cuts[94], 2) if latencies else None,
+        'p99_ms': round(cuts[98], 2) if latencies else None
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(port, workers, env):
+    # Run from ROOT so gunicorn.conf.py supplies the gevent worker and its worker_connections
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+        cwd=ROOT, env=env
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start within 30s')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--tickets', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--target', nargs='+', choices=['client', 'gunicorn'], default=['client', 'gunicorn'])
+    parser.add_argument('--gunicorn-workers', type=int, default=2)
+    parser.add_argument('--scenario', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+
+    run_db = fixtures.use_throwaway_database()
+    seed_db = os.path.join(os.path.dirname(run_db), 'seed.db')
+    # Instrumentation would skew the numbers; QR rendering stays in-process but off the request path
+    os.environ.pop('TIKOZETU_METRICS', None)
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    data = seed_dataset(args, rng)
+    print(f'seeded {args.users} users, {args.events} events, {args.tickets} tickets '
+          f'in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+    shutil.copyfile(run_db, seed_db)
+
+    from app import app, db
+    cookies = {
+        role: {user_id: fixtures.session_cookie(user_id, role) for user_id in data[f'{role}_ids']}
+        for role in ['attendee', 'organizer']
+    }
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'dataset': {'users': args.users, 'events': args.events, 'tickets': args.tickets, 'seed': args.seed},
+        'settings': {'requests': args.requests, 'concurrency': args.concurrency,
+                     'gunicorn_workers': args.gunicorn_workers},
+        'results': {}
+    }
+
+    for target in args.target:
+        # Each target starts from the same freshly seeded data
+        with app.app_context():
+            db.engine.dispose()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(run_db + suffix):
+                os.remove(run_db + suffix)
+        shutil.copyfile(seed_db, run_db)
+
+        plan = build_plan(data, cookies, args, random.Random(args.seed))
+        process = None
+        if target == 'client':
+            send = client_sender(app)
+        else:
+            port = free_port()
+            process = start_gunicorn(port, args.gunicorn_workers, dict(os.environ))
+            send = http_sender(port)
+        try:
+            # Let every worker run its one-off schema check before anything is timed
+            for _ in range(args.gunicorn_workers * 4):
+                send('GET', '/api/events?limit=1', None, None)
+            results = report['results'][target] = {}
+            for scenario in args.scenario:
+                results[scenario] = run_scenario(send, plan[scenario], args.concurrency)
+                result = results[scenario]
+                print(f'{target:>8} {scenario:<24} {result["throughput_rps"]:>8} req/s  '
+                      f'p50 {result["p50_ms"]:>7}ms  p95 {result["p95_ms"]:>7}ms  '
+                      f'p99 {result["p99_ms"]:>7}ms  errors {result["errors"]}', file=sys.stderr)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Time the hot read endpoints before and after archiving past events.
+
+Usage: python bench/archive.py [--users 5000] [--events 2000] [--tickets 200000]
+                               [--past 0.8] [--requests 50]
+
+Seeds a synthetic dataset into a throwaway SQLite database and moves --past
+of its events into the past, with their pending payments settled. It times
+the event listing, organizer dashboard, pending-payments queue and ticket
+wallet, runs the archive job, and times them again. The archived rows are
+then read back with archived=1. Checks that every ticket and payment
+ended up in exactly one of the two databases.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--tickets', type=int, default=200000)
+    parser.add_argument('--past', type=float, default=0.8, help='fraction of events dated in the past')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per endpoint')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    fixtures.use_throwaway_database()
+    os.environ.pop('TIKOZETU_ARCHIVE_PATH', None)
+
+    import app as tikozetu
+    from app import (app, db, archive_past_events, check_and_update_schema, rebuild_event_stats,
+                     seed_synthetic_data, Event, Payment, Ticket)
+    from sqlalchemy import text
+
+    # Time the queries, not the response cache
+    tikozetu.response_cache.max_bytes = 0
+
+    with app.app_context():
+        check_and_update_schema(sample_data=False)
+        started = time.perf_counter()
+        seed_synthetic_data(args.users, args.events, args.tickets, random_seed=args.seed)
+        now = datetime.utcnow()
+        event_ids = db.session.execute(db.select(Event.id).order_by(Event.id)).scalars().all()
+        past = event_ids[:int(len(event_ids) * args.past)]
+        db.session.execute(text('UPDATE event SET date = :date WHERE id = :id'), [
+            {'id': event_id, 'date': now - timedelta(days=200 + event_id % 700)} for event_id in past
+        ])
+        # History is settled: organizers long since dealt with those payments
+        db.session.execute(text(
+            "UPDATE payment SET status = 'rejected' WHERE status = 'pending' AND ticket_id IN "
+            "(SELECT ticket.id FROM ticket JOIN event ON event.id = ticket.event_id WHERE event.date < :now)"
+        ), {'now': now})
+        rebuild_event_stats()
+        db.session.commit()
+        totals = (Ticket.query.count(), Payment.query.count())
+        organizer_id = db.session.execute(text(
+            'SELECT organizer_id FROM event GROUP BY organizer_id ORDER BY COUNT(*) DESC LIMIT 1'
+        )).scalar()
+        attendee_id = db.session.execute(text(
+            'SELECT attendee_id FROM ticket GROUP BY attendee_id ORDER BY COUNT(*) DESC LIMIT 1'
+        )).scalar()
+        db.engine.dispose()
+    print(f'seeded {args.users} users, {args.events} events ({len(past)} past), {args.tickets} tickets '
+          f'in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+    cookies = {
+        'organizer': fixtures.session_cookie(organizer_id, 'organizer'),
+        'attendee': fixtures.session_cookie(attendee_id, 'attendee')
+    }
+    endpoints = [
+        ('events?category=Music', '/api/events?category=Music', None),
+        ('events?min_price=2000', '/api/events?min_price=2000', None),
+        ('organizer dashboard', '/api/organizer/dashboard', 'organizer'),
+        ('pending payments', '/api/organizer/payments/pending', 'organizer'),
+        ('ticket wallet', '/api/user/tickets', 'attendee'),
+    ]
+    client = app.test_client(use_cookies=False)
+
+    def measure(path, role):
+        headers = {'Cookie': f'session={cookies[role]}'} if role else {}
+        timings = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            response = client.get(path, headers=headers)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'{path} returned {response.status_code}')
+        return statistics.median(timings), len(response.json)
+
+    before = {name: measure(path, role) for name, path, role in endpoints}
+
+    with app.app_context():
+        started = time.perf_counter()
+        counts = archive_past_events(datetime.utcnow())
+        elapsed = time.perf_counter() - started
+        hot = (Ticket.query.count(), Payment.query.count())
+        archived = tuple(db.session.execute(text(f'SELECT COUNT(*) FROM archive.{name}')).scalar()
+                         for name in ['ticket', 'payment'])
+    moved = counts['tickets'] + counts['payments']
+    print(f"archived {counts['events']} events, {counts['tickets']} tickets and {counts['payments']} payments "
+          f"in {elapsed:.2f}s ({moved / elapsed if elapsed else 0:,.0f} rows/s); {counts['skipped']} events skipped, "
+          f"{counts['conflicts']} with clashing ids")
+
+    after = {name: measure(path, role) for name, path, role in endpoints}
+    print(f'{"endpoint":<24} {"before ms":>10} {"rows":>6} {"after ms":>10} {"rows":>6}')
+    for name, _, _ in endpoints:
+        print(f'{name:<24} {before[name][0]:>10.2f} {before[name][1]:>6} {after[name][0]:>10.2f} {after[name][1]:>6}')
+    for name, path, role in [('archived events', '/api/events?archived=1&category=Music', None),
+                             ('archived wallet', '/api/user/tickets?archived=1', 'attendee')]:
+        median_ms, rows = measure(path, role)
+        print(f'{name:<24} {"":>10} {"":>6} {median_ms:>10.2f} {rows:>6}')
+
+    if (hot[0] + archived[0], hot[1] + archived[1]) != totals:
+        print(f'FAIL: {totals} tickets/payments before, {hot} live + {archived} archived after')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
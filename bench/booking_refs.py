@@ -0,0 +1,71 @@
+"""Benchmark booking reference issuing and check the generator's guarantees.
+
+Usage: python bench/booking_refs.py [--count 1000000] [--sample 20000]
+
+Issues --count references with generate_booking_reference, reporting the
+rate next to the old random.choices scheme, and checks that they are all
+distinct, come out in sorted order and pass their own check character.
+It then mistypes a sample (one wrong character, or two neighbours swapped)
+and reports how many the check character catches without a lookup.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=1000000)
+    parser.add_argument('--sample', type=int, default=20000)
+    args = parser.parse_args()
+
+    from app import BOOKING_REF_ALPHABET, booking_reference_looks_valid, generate_booking_reference
+
+    started = time.perf_counter()
+    legacy = [''.join(random.choices(string.ascii_uppercase + string.digits, k=10)) for _ in range(args.count)]
+    legacy_elapsed = time.perf_counter() - started
+    del legacy
+
+    started = time.perf_counter()
+    references = [generate_booking_reference() for _ in range(args.count)]
+    elapsed = time.perf_counter() - started
+
+    print(f'{args.count} references')
+    print(f'random.choices (old): {legacy_elapsed:.2f}s ({args.count / legacy_elapsed:,.0f}/s)')
+    print(f'generate_booking_reference: {elapsed:.2f}s ({args.count / elapsed:,.0f}/s), '
+          f'e.g. {references[0]} .. {references[-1]}')
+
+    distinct = len(set(references)) == len(references)
+    ordered = all(a < b for a, b in zip(references, references[1:]))
+    valid = all(booking_reference_looks_valid(reference) for reference in references)
+    print(f'distinct={distinct} sorted={ordered} check characters valid={valid}')
+
+    rng = random.Random(0)
+    substitutions = transpositions = caught_substitutions = caught_transpositions = 0
+    for reference in rng.sample(references, min(args.sample, len(references))):
+        position = rng.randrange(len(reference))
+        wrong = rng.choice(BOOKING_REF_ALPHABET.replace(reference[position], ''))
+        substitutions += 1
+        caught_substitutions += not booking_reference_looks_valid(reference[:position] + wrong + reference[position + 1:])
+
+        position = rng.randrange(len(reference) - 1)
+        if reference[position] != reference[position + 1]:
+            swapped = reference[:position] + reference[position + 1] + reference[position] + reference[position + 2:]
+            transpositions += 1
+            caught_transpositions += not booking_reference_looks_valid(swapped)
+    print(f'single-character typos caught: {caught_substitutions}/{substitutions}')
+    print(f'adjacent swaps caught: {caught_transpositions}/{transpositions}')
+
+    if not (distinct and ordered and valid and caught_substitutions == substitutions):
+        print('FAILED')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
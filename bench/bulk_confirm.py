@@ -0,0 +1,60 @@
+"""Compare bulk payment confirmation against looping over the single-item endpoint.
+
+Usage: python bench/bulk_confirm.py [--payments 1000] [--batch 1000]
+
+Seeds one event with seed_synthetic_data, a fifth of whose tickets carry a
+pending payment, and confirms --payments of them each way.
+"""
+import argparse
+import time
+
+import fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--payments', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=1000)
+    args = parser.parse_args()
+
+    fixtures.use_throwaway_database()
+    import app as tikozetu
+    from app import app, db, Payment
+
+    with app.app_context():
+        # Enough tickets that about 2.4x --payments of them are pending
+        organizer_ids, _ = fixtures.seed(events=1, tickets=args.payments * 12)
+        pending_ids = db.session.execute(
+            db.select(Payment.id).where(Payment.status == 'pending').order_by(Payment.id)
+        ).scalars().all()
+    if len(pending_ids) < 2 * args.payments:
+        raise RuntimeError(f'only {len(pending_ids)} pending payments were seeded')
+    single_ids = pending_ids[:args.payments]
+    bulk_ids = pending_ids[args.payments:2 * args.payments]
+
+    client = fixtures.logged_in_client(organizer_ids[0], 'organizer')
+
+    started = time.perf_counter()
+    for payment_id in single_ids:
+        assert client.post(f'/api/organizer/payments/{payment_id}/confirm').status_code == 200
+    single_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(0, len(bulk_ids), args.batch):
+        response = client.post('/api/organizer/payments/bulk', json={
+            'action': 'confirm', 'payment_ids': bulk_ids[i:i + args.batch]
+        })
+        assert response.status_code == 200 and response.json['updated'] == len(bulk_ids[i:i + args.batch])
+    bulk_elapsed = time.perf_counter() - started
+
+    if tikozetu._qr_executor is not None:
+        tikozetu._qr_executor.shutdown(wait=True)
+
+    print(f'{args.payments} payments per run')
+    print(f'single endpoint loop: {single_elapsed:.2f}s ({args.payments / single_elapsed:.0f} payments/s)')
+    print(f'bulk endpoint (batch {args.batch}): {bulk_elapsed:.2f}s ({args.payments / bulk_elapsed:.0f} payments/s)')
+    print(f'speedup: {single_elapsed / bulk_elapsed:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Measure sustained gate check-in throughput on SQLite.
+
+Usage: python bench/checkin.py [--tickets 5000] [--scanners 8]
+
+Seeds one event with seed_synthetic_data, then has several scanner threads
+post the QR payload of every paid ticket to /api/checkin, followed by a
+second pass that must reject every ticket as a duplicate.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=5000)
+    parser.add_argument('--scanners', type=int, default=8)
+    args = parser.parse_args()
+
+    fixtures.use_throwaway_database()
+    from app import app, db, ticket_qr_payload, Ticket
+
+    with app.app_context():
+        organizer_ids, _ = fixtures.seed(events=1, tickets=args.tickets)
+        tickets = db.session.execute(db.select(
+            Ticket.booking_reference, Ticket.event_id, Ticket.attendee_id, Ticket.quantity
+        ).where(Ticket.payment_status == 'paid')).all()
+        codes = [ticket_qr_payload(ticket) for ticket in tickets]
+
+    def scan_all(batch):
+        client = fixtures.logged_in_client(organizer_ids[0], 'organizer')
+        return [client.post('/api/checkin', json={'code': code}).status_code for code in batch]
+
+    def run_pass():
+        batches = [codes[i::args.scanners] for i in range(args.scanners)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.scanners) as pool:
+            statuses = [status for batch in pool.map(scan_all, batches) for status in batch]
+        return statuses, time.perf_counter() - started
+
+    first, first_elapsed = run_pass()
+    second, second_elapsed = run_pass()
+
+    print(f'{len(codes)} paid tickets, {args.scanners} scanners')
+    print(f'admit pass:     {first_elapsed:.2f}s ({len(codes) / first_elapsed:.0f} scans/s), '
+          f'admitted={first.count(200)} other={len(first) - first.count(200)}')
+    print(f'duplicate pass: {second_elapsed:.2f}s ({len(codes) / second_elapsed:.0f} scans/s), '
+          f'rejected={second.count(409)} other={len(second) - second.count(409)}')
+
+    if first.count(200) != len(codes) or second.count(409) != len(codes):
+        print('FAIL')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
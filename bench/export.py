@@ -0,0 +1,53 @@
+"""Check that event exports stream with flat memory use.
+
+Usage: python bench/export.py [--tickets 20000 50000]
+
+Seeds one event per --tickets size with seed_synthetic_data, then streams
+every export type and format through the test client and reports the
+time, bytes written and peak Python allocation while streaming. Peak
+memory should stay roughly constant as events grow.
+"""
+import argparse
+import time
+import tracemalloc
+
+import fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickets', type=int, nargs='+', default=[20000, 50000])
+    args = parser.parse_args()
+
+    fixtures.use_throwaway_database()
+    from app import app, db, Event
+
+    events = []
+    with app.app_context():
+        for size in args.tickets:
+            # Each seeded event gets an organizer of its own
+            organizer_ids, _ = fixtures.seed(events=1, tickets=size)
+            event_id = db.session.execute(
+                db.select(Event.id).where(Event.organizer_id == organizer_ids[0])
+            ).scalar_one()
+            events.append((size, event_id, fixtures.logged_in_client(organizer_ids[0], 'organizer')))
+
+    print(f'{"tickets":>8} {"export":>18} {"seconds":>8} {"MB out":>8} {"peak MB":>8}')
+    for size, event_id, client in events:
+        for export_type in ['attendees', 'payments']:
+            for export_format in ['csv', 'ndjson']:
+                url = f'/api/organizer/events/{event_id}/export?type={export_type}&format={export_format}'
+                tracemalloc.start()
+                started = time.perf_counter()
+                response = client.get(url, buffered=False)
+                written = sum(len(chunk) for chunk in response.response)
+                response.close()
+                elapsed = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f'{size:>8} {export_type + "/" + export_format:>18} {elapsed:>8.2f} '
+                      f'{written / 1e6:>8.1f} {peak / 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
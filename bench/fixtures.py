@@ -0,0 +1,84 @@
+"""Shared setup for the benchmark scripts.
+
+Every benchmark runs against a throwaway SQLite database in its own temp
+directory, never the app's own. Import this module before the app: it puts
+the repository root on sys.path, and the app reads its database URI once,
+at import.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def throwaway_database():
+    """Return the path of a new, not yet created SQLite file in its own temp directory"""
+    return os.path.join(tempfile.mkdtemp(prefix='tikozetu-bench-'), 'bench.db')
+
+
+def sqlite_uri(path):
+    return f'sqlite:///{path}'
+
+
+def use_throwaway_database():
+    """Point the app at a throwaway database before it is imported; returns the file's path"""
+    path = throwaway_database()
+    os.environ['TIKOZETU_DATABASE_URI'] = sqlite_uri(path)
+    return path
+
+
+def seed(attendees=0, events=0, tickets=0, random_seed=1):
+    """Migrate the database and bulk-load it with seed_synthetic_data.
+
+    Creates at least `attendees` attendee accounts plus the organizers that
+    come with them (one per hundred users, and always one). Returns
+    (organizer_ids, attendee_ids); with no attendees, the organizer is also
+    the one holding any seeded tickets. Call inside an app context.
+    """
+    from app import db, check_and_update_schema, seed_synthetic_data, User
+
+    users = attendees + 1
+    while users - max(1, users // 100) < attendees:
+        users += 1
+
+    check_and_update_schema(sample_data=False)
+    first_user = (db.session.execute(db.select(db.func.max(User.id))).scalar() or 0) + 1
+    seed_synthetic_data(users, events, tickets, random_seed=random_seed)
+    rows = db.session.execute(db.select(User.id, User.role).where(User.id >= first_user).order_by(User.id)).all()
+    organizer_ids = [user_id for user_id, role in rows if role == 'organizer']
+    attendee_ids = [user_id for user_id, role in rows if role == 'attendee'] or organizer_ids
+    return organizer_ids, attendee_ids
+
+
+def create_event(organizer_id, title, capacity, price=100.0, days=30):
+    """Add one event with `capacity` seats, `days` from now; returns its id. Call inside an app context."""
+    from app import db, Event
+
+    event = Event(
+        title=title, description=f'{title} benchmark', category='Music',
+        date=datetime.utcnow() + timedelta(days=days), location='Nairobi',
+        price=price, capacity=capacity, organizer_id=organizer_id
+    )
+    db.session.add(event)
+    db.session.commit()
+    return event.id
+
+
+def session_cookie(user_id, role):
+    """A signed session cookie for a user, so benchmarks skip the deliberately slow login"""
+    from app import app
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps({'user_id': user_id, 'user_role': role})
+
+
+def logged_in_client(user_id, role):
+    """A test client whose requests carry the user's session"""
+    from app import app
+
+    client = app.test_client(use_cookies=False)
+    client.environ_base['HTTP_COOKIE'] = f'session={session_cookie(user_id, role)}'
+    return client
@@ -0,0 +1,136 @@
+"""Replay retry storms against booking and payment submission and count the rows written.
+
+Usage: python bench/idempotency.py [--clients 50] [--retries 1 3 5 10] [--workers 16]
+
+Each client books a ticket and then submits a payment for it, sending every
+request --retries times concurrently, the way a flaky mobile connection
+does. With an Idempotency-Key the ticket and payment counts stay at one per
+client however many retries arrive. Without a key every booking retry still
+creates a ticket, but a payment retry is refused, because a ticket has at most
+one active payment.
+
+Finally a booking is sent from a child process that dies the moment its
+transaction commits, before it can answer. Retrying that key must replay
+the booking rather than report it as still in progress.
+"""
+import argparse
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import fixtures
+from fixtures import ROOT
+
+# Books one ticket and exits with status 17 as soon as the session first commits
+CRASHING_BOOKING = """
+import os, sys
+sys.path.insert(0, sys.argv[1])
+from sqlalchemy.orm import Session
+from app import app
+commit = Session.commit
+def commit_and_die(session):
+    commit(session)
+    os._exit(17)
+Session.commit = commit_and_die
+app.test_client(use_cookies=False).post(
+    '/api/tickets/book', json={'event_id': int(sys.argv[2]), 'quantity': 1},
+    headers={'Cookie': f'session={sys.argv[3]}', 'Idempotency-Key': sys.argv[4]}
+)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--retries', type=int, nargs='+', default=[1, 3, 5, 10])
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    fixtures.use_throwaway_database()
+    from app import app, Ticket, Payment
+
+    with app.app_context():
+        organizer_ids, attendee_ids = fixtures.seed(attendees=args.clients)
+        event_id = fixtures.create_event(organizer_ids[0], 'Retry Storm', 1000000)
+
+    cookies = [fixtures.session_cookie(user_id, 'attendee') for user_id in attendee_ids[:args.clients]]
+
+    def send(item):
+        path, body, client, key = item
+        headers = {'Cookie': f'session={cookies[client]}'}
+        if key:
+            headers['Idempotency-Key'] = key
+        response = app.test_client(use_cookies=False).post(path, json=body, headers=headers)
+        ticket_id = response.json.get('ticket_id') if response.status_code == 201 else None
+        return client, response.status_code, response.headers.get('Idempotent-Replayed') == 'true', ticket_id
+
+    def storm(requests):
+        random.shuffle(requests)
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            return list(pool.map(send, requests))
+
+    def row_counts():
+        with app.app_context():
+            return Ticket.query.count(), Payment.query.count()
+
+    def describe(outcomes):
+        statuses = Counter(status for _, status, _, _ in outcomes)
+        replayed = sum(replay for _, _, replay, _ in outcomes)
+        return ' '.join(f'{code}={count}' for code, count in sorted(statuses.items())) + f' replayed={replayed}'
+
+    print(f'{args.clients} clients, {args.workers} concurrent requests')
+    print(f'{"mode":<8} {"retries":>7} {"requests":>9} {"tickets":>8} {"payments":>9} {"seconds":>8}  responses')
+    failed = False
+    for mode in ['no-key', 'key']:
+        for retries in args.retries:
+            tickets_before, payments_before = row_counts()
+            started = time.perf_counter()
+            bookings = storm([
+                ('/api/tickets/book', {'event_id': event_id, 'quantity': 1}, client,
+                 f'book-{retries}-{client}' if mode == 'key' else None)
+                for client in range(args.clients) for _ in range(retries)
+            ])
+            booked = {}
+            for client, _, _, ticket_id in bookings:
+                if ticket_id:
+                    booked.setdefault(client, ticket_id)
+            payments = storm([
+                (f'/api/tickets/{ticket_id}/submit-payment',
+                 {'payment_method': 'MPESA', 'payment_reference': f'{mode}{retries}X{client}'}, client,
+                 f'pay-{retries}-{client}' if mode == 'key' else None)
+                for client, ticket_id in booked.items() for _ in range(retries)
+            ])
+            elapsed = time.perf_counter() - started
+            tickets_after, payments_after = row_counts()
+
+            tickets = tickets_after - tickets_before
+            paid = payments_after - payments_before
+            print(f'{mode:<8} {retries:>7} {len(bookings) + len(payments):>9} {tickets:>8} {paid:>9} {elapsed:>8.2f}  '
+                  f'book: {describe(bookings)}; pay: {describe(payments)}')
+
+            expected_tickets = args.clients if mode == 'key' else args.clients * retries
+            if tickets != expected_tickets or paid != len(booked) or len(booked) != args.clients:
+                failed = True
+
+    if failed:
+        print('FAIL: retries changed the number of rows written')
+        return 1
+
+    tickets_before, _ = row_counts()
+    crashed = subprocess.run([sys.executable, '-c', CRASHING_BOOKING, ROOT, str(event_id), cookies[0], 'crash'])
+    _, status, replayed, _ = send(('/api/tickets/book', {'event_id': event_id, 'quantity': 1}, 0, 'crash'))
+    tickets = row_counts()[0] - tickets_before
+    print(f'died after commit (exit {crashed.returncode}): retry got {status}, '
+          f'{"replayed" if replayed else "not replayed"}, {tickets} ticket written')
+    if crashed.returncode != 17 or status != 201 or not replayed or tickets != 1:
+        print('FAIL: a booking committed by a process that then died was not replayed')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
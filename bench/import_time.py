@@ -0,0 +1,91 @@
+"""Measure the cold-start cost of importing the app and fail past a budget.
+
+Usage: python bench/import_time.py [--runs 5] [--budget-ms 1000] [--top 10]
+
+Imports app.py in fresh interpreters under `python -X importtime`, the way a
+serverless cold start or a new gunicorn worker does, and reports the median
+total import time with the slowest top-level imports. Fails (exit status 1)
+when the median is over --budget-ms, when a module that only QR rendering or
+profiling needs (qrcode, Pillow, multiprocessing, cProfile) is imported, or
+when importing the app opens the database.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+import fixtures
+from fixtures import ROOT
+
+LAZY_MODULES = ['qrcode', 'PIL', 'multiprocessing', 'concurrent.futures.process', 'cProfile']
+
+
+def import_app(env):
+    """Import app in a fresh interpreter; returns {module: (self_us, cumulative_us, depth)}"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'importing app failed:\n{result.stderr}')
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1000)
+    parser.add_argument('--top', type=int, default=10, help='slowest top-level imports to list')
+    args = parser.parse_args()
+
+    db_path = fixtures.throwaway_database()
+    env = dict(os.environ, TIKOZETU_DATABASE_URI=fixtures.sqlite_uri(db_path))
+    for name in ['TIKOZETU_METRICS', 'PYTHONDONTWRITEBYTECODE']:
+        env.pop(name, None)
+
+    # The first import writes bytecode caches; a deployed app ships with them warm
+    import_app(env)
+    totals, own = [], []
+    imports = defaultdict(list)
+    for _ in range(args.runs):
+        modules = import_app(env)
+        self_us, cumulative_us, _ = modules['app']
+        totals.append(cumulative_us / 1000)
+        own.append(self_us / 1000)
+        for name, (_, cumulative, depth) in modules.items():
+            if depth == 1:
+                imports[name].append(cumulative / 1000)
+
+    total = statistics.median(totals)
+    print(f'import app: median {total:.0f}ms over {args.runs} runs '
+          f'(min {min(totals):.0f}ms, max {max(totals):.0f}ms), app.py itself {statistics.median(own):.0f}ms')
+    slowest = sorted(imports.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:args.top]
+    for name, times in slowest:
+        print(f'  {statistics.median(times):>7.1f}ms  {name}')
+
+    failures = []
+    if total > args.budget_ms:
+        failures.append(f'import time {total:.0f}ms is over the {args.budget_ms:.0f}ms budget')
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        failures.append(f'imported at startup: {", ".join(eager)}')
+    if os.path.exists(db_path):
+        failures.append('importing the app opened the database')
+
+    for failure in failures:
+        print(f'FAILED: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Upgrade a copy of the committed database and check the dashboard counters.
+
+Usage: python bench/migrate.py [--database instance/tikozetu.db] [--processes 8]
+
+Copies --database (the pre-migration database shipped in instance/) into a
+throwaway location and counts each event's tickets, paid tickets, revenue
+and pending payments straight from its tables. It then starts --processes
+`flask migrate` runs against the copy at once, as workers starting together
+would, and every one must succeed. Every organizer's dashboard must then
+report the same counters as the tables.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+from contextlib import closing
+
+import fixtures
+from fixtures import ROOT
+
+
+def expected_counters(path):
+    """{event_id: (organizer_id, total, confirmed, pending, revenue)} read without the app"""
+    with closing(sqlite3.connect(path)) as connection:
+        return {row[0]: row[1:] for row in connection.execute(
+            "SELECT event.id, event.organizer_id, "
+            "(SELECT COUNT(*) FROM ticket WHERE ticket.event_id = event.id AND payment_status != 'expired'), "
+            "(SELECT COUNT(*) FROM ticket WHERE ticket.event_id = event.id AND payment_status = 'paid'), "
+            "(SELECT COUNT(*) FROM payment JOIN ticket ON ticket.id = payment.ticket_id "
+            "WHERE ticket.event_id = event.id AND payment.status = 'pending'), "
+            "(SELECT COALESCE(SUM(total_price), 0) FROM ticket WHERE ticket.event_id = event.id "
+            "AND payment_status = 'paid') FROM event"
+        )}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default=os.path.join(ROOT, 'instance', 'tikozetu.db'))
+    parser.add_argument('--processes', type=int, default=8, help='migrations started at once')
+    args = parser.parse_args()
+
+    db_path = fixtures.use_throwaway_database()
+    shutil.copyfile(args.database, db_path)
+    expected = expected_counters(db_path)
+
+    failures = []
+    processes = [subprocess.Popen([sys.executable, '-m', 'flask', '--app', 'app', 'migrate'], cwd=ROOT,
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                 for _ in range(args.processes)]
+    for number, process in enumerate(processes, start=1):
+        output = process.communicate()[0]
+        applied = output.count('Applied schema migration')
+        print(f'migration process {number}: exit {process.returncode}, applied {applied} migrations')
+        if process.returncode != 0:
+            failures.append(f'migration process {number} failed:\n{output}')
+    with closing(sqlite3.connect(db_path)) as connection:
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+    print(f'user_version {version}')
+    from app import SCHEMA_MIGRATIONS
+    if version != len(SCHEMA_MIGRATIONS):
+        failures.append(f'user_version is {version}, not {len(SCHEMA_MIGRATIONS)}')
+
+    for organizer_id in sorted({counters[0] for counters in expected.values()}):
+        response = fixtures.logged_in_client(organizer_id, 'organizer').get('/api/organizer/dashboard')
+        if response.status_code != 200:
+            failures.append(f'organizer {organizer_id}: dashboard returned {response.status_code}')
+            continue
+        for event in response.json:
+            reported = (event['total_tickets'], event['confirmed_tickets'], event['pending_payments'],
+                        event['revenue'])
+            wanted = expected[event['id']][1:]
+            print(f"event {event['id']:>4}: tickets={reported[0]} confirmed={reported[1]} "
+                  f"pending={reported[2]} revenue={reported[3]}")
+            if reported != wanted:
+                failures.append(f"event {event['id']}: dashboard shows {reported}, tables hold {wanted}")
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Fire a burst of parallel bookings at one event and check it never oversells.
+
+Usage: python bench/oversell.py [--bookings 400] [--capacity 100] [--workers 64]
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bookings', type=int, default=400)
+    parser.add_argument('--capacity', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=64)
+    args = parser.parse_args()
+
+    fixtures.use_throwaway_database()
+    from app import app, db, Event, Ticket
+
+    with app.app_context():
+        organizer_ids, attendee_ids = fixtures.seed(attendees=1)
+        event_id = fixtures.create_event(organizer_ids[0], 'Flash Sale', args.capacity)
+
+    def book(_):
+        client = fixtures.logged_in_client(attendee_ids[0], 'attendee')
+        return client.post('/api/tickets/book', json={'event_id': event_id, 'quantity': 1}).status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        statuses = list(pool.map(book, range(args.bookings)))
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        sold = db.session.query(db.func.coalesce(db.func.sum(Ticket.quantity), 0)).filter(
+            Ticket.event_id == event_id
+        ).scalar()
+        remaining = db.session.get(Event, event_id).tickets_remaining
+
+    print(f'{args.bookings} bookings in {elapsed:.2f}s '
+          f'({args.bookings / elapsed:.0f}/s): '
+          + ', '.join(f'{code}={statuses.count(code)}' for code in sorted(set(statuses))))
+    print(f'capacity={args.capacity} sold={sold} remaining={remaining}')
+
+    if sold + remaining != args.capacity or sold > args.capacity:
+        print('FAIL: inventory is inconsistent')
+        return 1
+    if args.bookings >= args.capacity and sold != args.capacity:
+        print('FAIL: event did not sell out')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Compare on-demand QR rendering against the legacy PNG files on disk.
+
+Usage: python bench/qr_render.py [--iterations 200]
+
+The legacy renderer is the original confirm_payment code path: a Pillow
+image with box_size=10, border=5 saved as PNG. The on-demand renderer is
+render_qr_image (1-bit PNG or path-based SVG), measured cold and through
+the LRU cache.
+"""
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import qrcode
+
+from app import LRUCache, render_qr_image
+
+
+def render_legacy_png(qr_data):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer)
+    return buffer.getvalue()
+
+
+def timed(func, payloads, iterations):
+    started = time.perf_counter()
+    for i in range(iterations):
+        func(payloads[i % len(payloads)])
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    legacy_files = sorted(glob.glob(os.path.join(ROOT, 'static', 'qrcodes', '*.png')))
+    references = [os.path.splitext(os.path.basename(path))[0] for path in legacy_files] or ['ABCDEFGHIJ']
+    payloads = [f'TikoZetu|{ref}|1|3|1' for ref in references]
+
+    cache = LRUCache(8 * 1024 * 1024)
+
+    def cached_png(qr_data):
+        data = cache.get(('png', qr_data))
+        if data is None:
+            data = render_qr_image(qr_data, 'png')
+            cache.put(('png', qr_data), data)
+        return data
+
+    rows = [
+        ('legacy Pillow PNG (box 10)', render_legacy_png),
+        ('on-demand 1-bit PNG', lambda qr_data: render_qr_image(qr_data, 'png')),
+        ('on-demand SVG', lambda qr_data: render_qr_image(qr_data, 'svg')),
+        ('cached 1-bit PNG', cached_png),
+    ]
+
+    print(f'{len(payloads)} payloads, {args.iterations} renders each')
+    print(f'{"renderer":<28} {"ms/render":>10} {"avg bytes":>10}')
+    for name, func in rows:
+        ms = timed(func, payloads, args.iterations)
+        avg_bytes = sum(len(func(payload)) for payload in payloads) / len(payloads)
+        print(f'{name:<28} {ms:>10.3f} {avg_bytes:>10.0f}')
+
+    if legacy_files:
+        on_disk = sum(os.path.getsize(path) for path in legacy_files) / len(legacy_files)
+        print(f'{"legacy files on disk":<28} {"-":>10} {on_disk:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
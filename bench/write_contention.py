@@ -0,0 +1,93 @@
+"""Measure booking throughput under write contention, with and without DB tuning.
+
+Usage: python bench/write_contention.py [--workers 8] [--bookings 200]
+
+Each worker is a separate process, like a gunicorn worker, that books a
+ticket for one hot event and submits its payment in a loop. The run is
+repeated with TIKOZETU_DB_TUNING=0 (driver defaults: rollback journal,
+5s lock timeout, default pool) and with the tuned engine (WAL,
+synchronous=NORMAL, busy_timeout, mmap and cache pragmas). Each run gets
+its own fresh database.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import fixtures
+
+
+def setup(capacity):
+    from app import app
+
+    with app.app_context():
+        organizer_ids, attendee_ids = fixtures.seed(attendees=1)
+        event_id = fixtures.create_event(organizer_ids[0], 'Hot Event', capacity)
+        print(json.dumps({'event_id': event_id, 'attendee_id': attendee_ids[0]}))
+
+
+def worker(event_id, attendee_id, bookings):
+    client = fixtures.logged_in_client(attendee_id, 'attendee')
+
+    ok = errors = 0
+    started = time.perf_counter()
+    for i in range(bookings):
+        booked = client.post('/api/tickets/book', json={'event_id': event_id, 'quantity': 1})
+        if booked.status_code != 201:
+            errors += 1
+            continue
+        paid = client.post(f'/api/tickets/{booked.json["ticket_id"]}/submit-payment',
+                           json={'payment_reference': f'W{os.getpid()}N{i}'})
+        if paid.status_code == 200:
+            ok += 1
+        else:
+            errors += 1
+    print(json.dumps({'ok': ok, 'errors': errors, 'elapsed': time.perf_counter() - started}))
+
+
+def run(tuned, workers, bookings):
+    env = dict(os.environ,
+               TIKOZETU_DATABASE_URI=fixtures.sqlite_uri(fixtures.throwaway_database()),
+               TIKOZETU_DB_TUNING='1' if tuned else '0')
+
+    seeded = subprocess.run([sys.executable, __file__, '--setup', str(workers * bookings)],
+                            env=env, capture_output=True, text=True, check=True)
+    ids = json.loads(seeded.stdout.strip().splitlines()[-1])
+
+    processes = [
+        subprocess.Popen([sys.executable, __file__, '--worker', str(ids['event_id']),
+                          str(ids['attendee_id']), str(bookings)],
+                         env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for _ in range(workers)
+    ]
+    results = [json.loads(process.communicate()[0].strip().splitlines()[-1]) for process in processes]
+    # Interpreter start-up is excluded: the run lasts as long as its slowest worker's loop
+    elapsed = max(result['elapsed'] for result in results)
+
+    ok = sum(result['ok'] for result in results)
+    errors = sum(result['errors'] for result in results)
+    label = 'tuned  ' if tuned else 'default'
+    print(f'{label}: {ok} bookings+payments in {elapsed:.2f}s '
+          f'({ok / elapsed:.0f}/s), {errors} failed requests')
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--setup':
+        return setup(int(sys.argv[2]))
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        return worker(int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]))
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--bookings', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f'{args.workers} worker processes x {args.bookings} bookings')
+    run(False, args.workers, args.bookings)
+    run(True, args.workers, args.bookings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""gunicorn settings, picked up by `gunicorn app:app` from this directory.
+
+/api/stream keeps each logged-in browser's request open. gevent workers park
+an idle stream on a greenlet, so one worker holds thousands of them, where a
+sync or threaded worker would spend a whole thread per client. Notifications
+fan out within one process, so keep a single worker (the default) unless every
+client can live with only seeing changes made through its own worker.
+"""
+import os
+import subprocess
+import sys
+
+# Deployed behind one reverse proxy, whose X-Forwarded-For the rate limiters
+# trust; set TIKOZETU_PROXY_HOPS=0 when clients connect to gunicorn directly
+os.environ.setdefault('TIKOZETU_PROXY_HOPS', '1')
+
+worker_class = 'gevent'
+# Room for STREAM_MAX_SUBSCRIBERS open streams plus ordinary requests
+worker_connections = int(os.environ.get('TIKOZETU_WORKER_CONNECTIONS', 6000))
+
+
+def on_starting(server):
+    """Migrate the database once, before any worker forks, rather than on a worker's first request"""
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'migrate'],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
@@ -13,6 +13,10 @@ const nav = document.querySelector('nav');
 // Global variables
 let events = [];
 let currentUser = null;
+let eventsQuery = '';
+let eventsNextCursor = null;
+let pendingPayments = [];
+let pendingPaymentsCursor = null;
 
 // Modal Manager Class
 class ModalManager {
@@ -63,27 +67,43 @@ class ModalManager {
 const modalManager = new ModalManager();
 
 // API Helper Functions
+// Pass retries to resend after a network failure; pair it with an
+// Idempotency-Key header on writes so a retry cannot book or pay twice
 async function apiCall(url, options = {}) {
-    try {
-        const response = await fetch(url, {
-            headers: {
-                'Content-Type': 'application/json',
-                ...options.headers
-            },
-            ...options
-        });
-        
-        if (!response.ok) {
-            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    const { retries = 0, headers = {}, ...fetchOptions } = options;
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const response = await fetch(url, {
+                ...fetchOptions,
+                headers: {
+                    'Content-Type': 'application/json',
+                    ...headers
+                }
+            });
+            
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+            
+            return await response.json();
+        } catch (error) {
+            // fetch rejects with a TypeError only when the request never got a response
+            if (error instanceof TypeError && attempt < retries) {
+                continue;
+            }
+            console.error('API Call failed:', error);
+            throw error;
         }
-        
-        return await response.json();
-    } catch (error) {
-        console.error('API Call failed:', error);
-        throw error;
     }
 }
 
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 // Form Validation Helper
 function validateForm(formData, rules) {
     const errors = [];
@@ -152,12 +172,31 @@ function debounce(func, wait) {
 }
 
 // Event Management
-async function loadEvents() {
+async function fetchEventsPage(query = '', cursor = null) {
+    const params = new URLSearchParams();
+    if (query) params.set('q', query);
+    if (cursor) params.set('cursor', cursor);
+    
+    const response = await fetch(`/api/events?${params.toString()}`);
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+    
+    return {
+        events: await response.json(),
+        nextCursor: response.headers.get('X-Next-Cursor')
+    };
+}
+
+async function loadEvents(query = '') {
     try {
         const loadingElement = eventsGrid;
         setLoading(loadingElement, true, loadingElement.innerHTML);
         
-        events = await apiCall('/api/events');
+        const page = await fetchEventsPage(query);
+        eventsQuery = query;
+        events = page.events;
+        eventsNextCursor = page.nextCursor;
         renderEvents();
     } catch (error) {
         console.error('Error loading events:', error);
@@ -165,7 +204,23 @@ async function loadEvents() {
     }
 }
 
+async function loadMoreEvents(button) {
+    if (!eventsNextCursor) return;
+    
+    setLoading(button, true);
+    try {
+        const page = await fetchEventsPage(eventsQuery, eventsNextCursor);
+        events = events.concat(page.events);
+        eventsNextCursor = page.nextCursor;
+        renderEvents();
+    } catch (error) {
+        console.error('Error loading more events:', error);
+        setLoading(button, false);
+    }
+}
+
 function loadSampleEvents() {
+    eventsNextCursor = null;
     events = [
         {
             id: 1,
@@ -232,12 +287,26 @@ function renderEvents() {
         eventsGrid.appendChild(eventCard);
     });
     
+    if (eventsNextCursor) {
+        const loadMoreWrapper = document.createElement('div');
+        loadMoreWrapper.style.cssText = 'grid-column: 1 / -1; text-align: center;';
+        loadMoreWrapper.innerHTML = '<button class="btn btn-outline load-more-btn" style="color: var(--primary); border-color: var(--primary);">Load More Events</button>';
+        loadMoreWrapper.querySelector('.load-more-btn').addEventListener('click', function() {
+            loadMoreEvents(this);
+        });
+        eventsGrid.appendChild(loadMoreWrapper);
+    }
+    
     attachEventListeners();
 }
 
 // Event Listeners Management
 function attachEventListeners() {
-    // Use event delegation for dynamic content
+    // Use event delegation for dynamic content; the grid is re-rendered on
+    // search and pagination, so only bind the handler once
+    if (eventsGrid.dataset.listenersAttached) return;
+    eventsGrid.dataset.listenersAttached = 'true';
+    
     eventsGrid.addEventListener('click', function(e) {
         const bookBtn = e.target.closest('.book-btn');
         const detailsBtn = e.target.closest('.details-btn');
@@ -268,6 +337,8 @@ async function handleBookButtonClick(button) {
             try {
                 const data = await apiCall('/api/tickets/book', {
                     method: 'POST',
+                    headers: { 'Idempotency-Key': newIdempotencyKey() },
+                    retries: 2,
                     body: JSON.stringify({ 
                         event_id: parseInt(eventId), 
                         quantity: parseInt(quantity) 
@@ -470,6 +541,8 @@ function updateAuthUI(user) {
             <button class="btn btn-outline" id="logoutBtn">Logout</button>
         `;
         
+        startLiveUpdates();
+        
         // Re-attach event listeners
         document.getElementById('myTicketsBtn').addEventListener('click', openTicketsModal);
         document.getElementById('logoutBtn').addEventListener('click', logout);
@@ -479,6 +552,7 @@ function updateAuthUI(user) {
             showCreateEventButton();
         }
     } else {
+        stopLiveUpdates();
         authButtons.innerHTML = `
             <button class="btn btn-outline" id="loginBtn">Login</button>
             <button class="btn btn-primary" id="registerBtn">Register</button>
@@ -762,6 +836,8 @@ async function submitPaymentProof(ticketId) {
     try {
         await apiCall(`/api/tickets/${ticketId}/submit-payment`, {
             method: 'POST',
+            headers: { 'Idempotency-Key': newIdempotencyKey() },
+            retries: 2,
             body: JSON.stringify({
                 payment_reference: reference,
                 payment_method: method
@@ -807,7 +883,18 @@ function openTicketsModal() {
 
 async function loadUserTickets() {
     try {
-        const tickets = await apiCall('/api/user/tickets');
+        // The wallet is paginated; follow the cursor until every ticket is loaded
+        let tickets = [];
+        let cursor = null;
+        do {
+            const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+            const response = await fetch(`/api/user/tickets${params}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+            tickets = tickets.concat(await response.json());
+            cursor = response.headers.get('X-Next-Cursor');
+        } while (cursor);
         displayTickets(tickets);
     } catch (error) {
         document.getElementById('ticketsList').innerHTML = '<p>Error loading tickets</p>';
@@ -934,7 +1021,7 @@ function openTicketView(ticket) {
             <p><strong>Tickets:</strong> ${ticket.quantity}</p>
         </div>
         
-        <div style="margin: 1.5rem 0;">
+        <div id="ticketQrCode" style="margin: 1.5rem 0;">
             ${ticket.qr_code_path ? `<img src="${ticket.qr_code_path}" alt="QR Code" style="width: 150px; height: 150px;">` : ''}
         </div>
         
@@ -1127,6 +1214,25 @@ function openOrganizerDashboard() {
         // Refresh payments
         document.getElementById('refreshPayments').addEventListener('click', loadPendingPayments);
         
+        // Payment actions, using event delegation so re-rendering the list needs no new listeners
+        document.getElementById('paymentsList').addEventListener('click', function(e) {
+            const confirmBtn = e.target.closest('.confirm-payment-btn');
+            const rejectBtn = e.target.closest('.reject-payment-btn');
+            const loadMoreBtn = e.target.closest('.load-more-btn');
+            
+            if (confirmBtn) {
+                confirmPayment(confirmBtn.getAttribute('data-payment-id'));
+            }
+            
+            if (rejectBtn) {
+                rejectPayment(rejectBtn.getAttribute('data-payment-id'));
+            }
+            
+            if (loadMoreBtn) {
+                loadMorePendingPayments(loadMoreBtn);
+            }
+        });
+        
         // Analytics period change
         document.getElementById('analyticsPeriod').addEventListener('change', loadAnalytics);
     }
@@ -1162,6 +1268,7 @@ async function loadOrganizerEvents() {
     try {
         const events = await apiCall('/api/organizer/dashboard');
         displayOrganizerEvents(events);
+        updatePendingPaymentsBadge(events.reduce((total, event) => total + (event.pending_payments || 0), 0));
     } catch (error) {
         if (eventsList) {
             eventsList.innerHTML = `
@@ -1235,6 +1342,9 @@ function displayOrganizerEvents(events) {
                             • <i class="far fa-clock"></i> ${new Date(event.date).toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'})}
                         </p>
                     </div>
+                    ${event.archived ? `
+                    <span style="color: var(--gray);"><i class="fas fa-archive"></i> Archived</span>
+                    ` : `
                     <div style="display: flex; gap: 0.5rem; flex-wrap: wrap;">
                         <button class="btn btn-outline btn-sm view-event-btn" data-event-id="${event.id}">
                             <i class="fas fa-eye"></i> View
@@ -1243,6 +1353,7 @@ function displayOrganizerEvents(events) {
                             <i class="fas fa-ticket-alt"></i> Manage
                         </button>
                     </div>
+                    `}
                 </div>
                 
                 <div class="event-stats-grid">
@@ -1285,6 +1396,31 @@ function displayOrganizerEvents(events) {
     });
 }
 
+// The pending queue is paginated oldest first; the badge counts every page
+function updatePendingPaymentsBadge(count) {
+    const badge = document.getElementById('pendingPaymentsCount');
+    if (badge) {
+        if (count > 0) {
+            badge.textContent = count;
+            badge.style.display = 'flex';
+        } else {
+            badge.style.display = 'none';
+        }
+    }
+}
+
+async function fetchPendingPaymentsPage(params) {
+    const response = await fetch(`/api/organizer/payments/pending?${params.toString()}`);
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+    
+    return {
+        payments: await response.json(),
+        nextCursor: response.headers.get('X-Next-Cursor')
+    };
+}
+
 // Enhanced loadPendingPayments function
 async function loadPendingPayments() {
     const paymentsLoading = document.getElementById('paymentsLoading');
@@ -1294,19 +1430,10 @@ async function loadPendingPayments() {
     if (paymentsList) paymentsList.style.display = 'none';
     
     try {
-        const payments = await apiCall('/api/organizer/payments/pending');
-        displayPendingPayments(payments);
-        
-        // Update badge count
-        const badge = document.getElementById('pendingPaymentsCount');
-        if (badge) {
-            if (payments.length > 0) {
-                badge.textContent = payments.length;
-                badge.style.display = 'flex';
-            } else {
-                badge.style.display = 'none';
-            }
-        }
+        const page = await fetchPendingPaymentsPage(new URLSearchParams());
+        pendingPayments = page.payments;
+        pendingPaymentsCursor = page.nextCursor;
+        displayPendingPayments();
     } catch (error) {
         if (paymentsList) {
             paymentsList.innerHTML = `
@@ -1325,11 +1452,57 @@ async function loadPendingPayments() {
     }
 }
 
+async function loadMorePendingPayments(button) {
+    if (!pendingPaymentsCursor) return;
+    
+    setLoading(button, true);
+    try {
+        const page = await fetchPendingPaymentsPage(new URLSearchParams({ cursor: pendingPaymentsCursor }));
+        appendPendingPayments(page.payments);
+        pendingPaymentsCursor = page.nextCursor;
+        displayPendingPayments();
+    } catch (error) {
+        console.error('Error loading more payments:', error);
+        setLoading(button, false);
+    }
+}
+
+// Fetch only the payments submitted after the newest one on screen
+async function refreshPendingPayments() {
+    // Newer payments sit behind the Load More cursor until the last page is reached
+    if (pendingPaymentsCursor) return;
+    if (pendingPayments.length === 0) {
+        loadPendingPayments();
+        return;
+    }
+    
+    try {
+        const newest = pendingPayments[pendingPayments.length - 1];
+        const page = await fetchPendingPaymentsPage(new URLSearchParams({ since: newest.created_at }));
+        appendPendingPayments(page.payments);
+        pendingPaymentsCursor = page.nextCursor;
+        displayPendingPayments();
+    } catch (error) {
+        console.error('Error refreshing payments:', error);
+    }
+}
+
+function appendPendingPayments(payments) {
+    const shown = new Set(pendingPayments.map(payment => payment.payment_id));
+    pendingPayments = pendingPayments.concat(payments.filter(payment => !shown.has(payment.payment_id)));
+}
+
+function removePendingPayment(paymentId) {
+    pendingPayments = pendingPayments.filter(payment => payment.payment_id !== Number(paymentId));
+    displayPendingPayments();
+}
+
 // Enhanced displayPendingPayments function
-function displayPendingPayments(payments) {
+function displayPendingPayments() {
     const paymentsList = document.getElementById('paymentsList');
+    if (!paymentsList) return;
     
-    if (payments.length === 0) {
+    if (pendingPayments.length === 0 && !pendingPaymentsCursor) {
         paymentsList.innerHTML = `
             <div class="empty-state">
                 <i class="fas fa-check-circle"></i>
@@ -1340,7 +1513,7 @@ function displayPendingPayments(payments) {
         return;
     }
     
-    paymentsList.innerHTML = payments.map(payment => `
+    paymentsList.innerHTML = pendingPayments.map(payment => `
         <div class="ticket-item">
             <div style="display: flex; justify-content: between; align-items: start; margin-bottom: 1rem; flex-wrap: wrap; gap: 1rem;">
                 <div>
@@ -1369,21 +1542,13 @@ function displayPendingPayments(payments) {
         </div>
     `).join('');
     
-    // Add event listeners for payment actions using event delegation
-    paymentsList.addEventListener('click', function(e) {
-        const confirmBtn = e.target.closest('.confirm-payment-btn');
-        const rejectBtn = e.target.closest('.reject-payment-btn');
-        
-        if (confirmBtn) {
-            const paymentId = confirmBtn.getAttribute('data-payment-id');
-            confirmPayment(paymentId);
-        }
-        
-        if (rejectBtn) {
-            const paymentId = rejectBtn.getAttribute('data-payment-id');
-            rejectPayment(paymentId);
-        }
-    });
+    if (pendingPaymentsCursor) {
+        paymentsList.innerHTML += `
+            <div style="text-align: center; margin-top: 1rem;">
+                <button class="btn btn-outline load-more-btn" style="color: var(--primary); border-color: var(--primary);">Load More Payments</button>
+            </div>
+        `;
+    }
 }
 
 // Analytics function (placeholder - implement based on your backend)
@@ -1462,7 +1627,8 @@ async function confirmPayment(paymentId) {
         });
         
         alert('Payment confirmed successfully! The attendee can now access their ticket.');
-        loadPendingPayments();
+        removePendingPayment(paymentId);
+        loadOrganizerEvents();
     } catch (error) {
         alert('Error: ' + error.message);
     }
@@ -1477,12 +1643,62 @@ async function rejectPayment(paymentId) {
         });
         
         alert('Payment rejected successfully.');
-        loadPendingPayments();
+        removePendingPayment(paymentId);
+        loadOrganizerEvents();
     } catch (error) {
         alert('Error: ' + error.message);
     }
 }
 
+// Live updates pushed from /api/stream
+let liveUpdates = null;
+const liveRefreshTimers = {};
+
+// Coalesce bursts of notifications (e.g. a bulk confirm) into one reload
+function scheduleLiveRefresh(modalId, refresh) {
+    if (modalManager.currentModal !== modalId) return;
+    clearTimeout(liveRefreshTimers[modalId]);
+    liveRefreshTimers[modalId] = setTimeout(() => {
+        if (modalManager.currentModal === modalId) refresh();
+    }, 500);
+}
+
+function startLiveUpdates() {
+    if (liveUpdates || !window.EventSource) return;
+    
+    liveUpdates = new EventSource('/api/stream');
+    const refreshTickets = () => scheduleLiveRefresh('ticketsModal', loadUserTickets);
+    const refreshDashboard = () => scheduleLiveRefresh('organizerDashboardModal', () => {
+        loadOrganizerEvents();
+        refreshPendingPayments();
+    });
+    
+    liveUpdates.addEventListener('ticket_status', refreshTickets);
+    liveUpdates.addEventListener('ticket_qr', refreshTickets);
+    liveUpdates.addEventListener('payment_pending', refreshDashboard);
+    liveUpdates.addEventListener('payment_resolved', (e) => {
+        if (modalManager.currentModal === 'organizerDashboardModal') {
+            removePendingPayment(JSON.parse(e.data).payment_id);
+        }
+        refreshDashboard();
+    });
+    liveUpdates.addEventListener('event_stats', refreshDashboard);
+    liveUpdates.addEventListener('resync', () => {
+        refreshTickets();
+        scheduleLiveRefresh('organizerDashboardModal', () => {
+            loadOrganizerEvents();
+            loadPendingPayments();
+        });
+    });
+}
+
+function stopLiveUpdates() {
+    if (liveUpdates) {
+        liveUpdates.close();
+        liveUpdates = null;
+    }
+}
+
 // Logout function
 async function logout() {
     try {
@@ -1525,28 +1741,14 @@ function setupSearch() {
     
     if (!searchInput || !searchButton) return;
     
-    const performSearch = () => {
-        const searchTerm = searchInput.value.toLowerCase().trim();
+    const performSearch = async () => {
+        const searchTerm = searchInput.value.trim();
+        if (searchTerm === eventsQuery) return;
+        
+        // Filtering happens server-side against the search index
+        await loadEvents(searchTerm);
         if (searchTerm) {
-            const filteredEvents = events.filter(event => 
-                event.title.toLowerCase().includes(searchTerm) ||
-                event.category.toLowerCase().includes(searchTerm) ||
-                event.location.toLowerCase().includes(searchTerm) ||
-                event.description?.toLowerCase().includes(searchTerm)
-            );
-            
-            if (filteredEvents.length > 0) {
-                const originalEvents = [...events];
-                events = filteredEvents;
-                renderEvents();
-                document.getElementById('events').scrollIntoView({ behavior: 'smooth' });
-                // Restore original events after showing filtered results
-                setTimeout(() => { events = originalEvents; }, 100);
-            } else {
-                alert('No events found matching your search.');
-            }
-        } else {
-            loadEvents();
+            document.getElementById('events').scrollIntoView({ behavior: 'smooth' });
         }
     };
     